@@ -1,23 +1,37 @@
 import os
 import sys
-import csv
 import time
+import signal
+import multiprocessing as mp
 import datetime as dt
+from decimal import Decimal
 from pathlib import Path
-from glob import glob
-from typing import List, Optional, Tuple
+from multiprocessing.util import Finalize
+from typing import Dict, List, Optional, Tuple
 
 from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-try:
-    from webdriver_manager.chrome import ChromeDriverManager  # type: ignore
-except Exception:  # pragma: no cover
-    ChromeDriverManager = None  # type: ignore
+from browser import build_chrome, env_bool
+from checkpoint import Checkpoint, install_signal_handlers
+from chrome_daemon import lease_browser, release_lease
+from chrome_profile import clone_profile, profile_tmpfs, stage_profile
+from direct_report import BATCH_TOTALS_JS, CAPTURE_FORM_JS, DirectReportClient
+from excel_export import (
+    aggregate_daily_totals,
+    format_amount,
+    iter_xlsx_rows,
+    wait_for_download,
+)
+from jsonl_stream import JsonlStream
+from phase_timing import PhaseTimer
+from report_html import normalize_total
+from report_engine import ReportEngine
+from report_spec import load_spec
+from report_wait import generation_done, report_changed
+from session_state import session_file
 
 
 # =========================
@@ -27,86 +41,77 @@ except Exception:  # pragma: no cover
 # Port is relevant for remote-debugging flows on Windows; kept for reference.
 PORT = 9222
 
+# Pages, role and selectors of the Debiting report: config/reports/project.toml
+SPEC = load_spec("project")
+
 # Pinned CSV file path (store reports under ./reports on host)
-CSV_FILE = "reports/project.csv"
+CSV_FILE = str(SPEC.csv_file)
 
 # Pinned URLs and role for Project Manager scenario
-REPORT_URL = "https://officemanager.dodopizza.ru/OfficeManager/Debiting/PrepareExcelReport"
-SELECT_DEPARTMENT_URL = "https://officemanager.dodopizza.ru/Infrastructure/Authenticate/SelectDepartment"
-BACK_TO_SELECT_ROLE_URL = "https://officemanager.dodopizza.ru/Infrastructure/Authenticate/BackToSelectRole"
-ROLE_ID = "8"
+REPORT_URL = SPEC.report_url
+SELECT_DEPARTMENT_URL = SPEC.select_department_url
+BACK_TO_SELECT_ROLE_URL = SPEC.back_to_select_role_url
+ROLE_ID = SPEC.role_id
 
 # Optional slow delay can still be overridden via env
 SLOW_DELAY = float(os.environ.get("SLOW_DELAY", "0"))
 
+# Number of worker processes (each with its own Chrome); 1 = sequential run
+WORKERS = int(os.environ.get("WORKERS", "1") or "1")
 
-# =========================
-# Helpers / driver bootstrap
-# =========================
+# Number of report tabs per Chrome; departments of a city are built in parallel
+TABS = int(os.environ.get("TABS", "1") or "1")
 
-def env_bool(name: str, default: bool = False) -> bool:
-    val = os.environ.get(name)
-    if val is None:
-        return default
-    return str(val).strip().lower() in {"1", "true", "yes", "y", "on"}
+# ENGINE=direct replays the report form over HTTP with the browser's cookies;
+# ENGINE=batch replays it for all dates of a department with fetch() inside the page
+ENGINE = os.environ.get("ENGINE", "browser").strip().lower()
+DIRECT_CONCURRENCY = int(os.environ.get("DIRECT_CONCURRENCY", "8") or "8")
 
+# OBSERVER_WAIT=1 waits for #report via MutationObserver in one async script call
+REPORT_TIMEOUT = float(os.environ.get("REPORT_TIMEOUT", "10") or "10")
 
-def cleanup_profile_locks(user_data_dir: Path) -> None:
-    try:
-        targets = []
-        for sub in (user_data_dir, user_data_dir / "Default"):
-            for pattern in ("Singleton*", "DevToolsActivePort"):
-                targets.extend(Path(p) for p in glob(str(sub / pattern)))
-        for p in targets:
-            try:
-                if p.is_file() or p.is_symlink():
-                    p.unlink(missing_ok=True)
-            except Exception:
-                pass
-    except Exception:
-        pass
-
+# FAST_SWITCH=1 changes city by posting the SelectDepartment form from the current page
+FAST_SWITCH = env_bool("FAST_SWITCH", False)
 
-def build_chrome(headless: bool, user_data_dir: Path) -> webdriver.Chrome:
-    options = Options()
+# ENGINE=excel downloads one Excel export per city into DOWNLOAD_DIR
+DOWNLOAD_DIR = os.environ.get("DOWNLOAD_DIR", "reports/downloads")
+EXCEL_TIMEOUT = float(os.environ.get("EXCEL_TIMEOUT", "120") or "120")
+EXCEL_BUTTON_SELECTOR = os.environ.get(
+    "EXCEL_BUTTON_SELECTOR",
+    '[name="excelButton"], #excelButton, #buildExcelButton, [name="excelReportButton"], button[value="excel"]',
+)
 
-    # Reuse existing authenticated profile
-    options.add_argument(f"--user-data-dir={str(user_data_dir)}")
-    (user_data_dir / "Default").mkdir(parents=True, exist_ok=True)
+# INCREMENTAL=1 keeps a ledger of collected days; days older than
+# FINAL_AFTER_DAYS are considered final and are not fetched again
+LEDGER_PATH = os.environ.get("LEDGER_PATH", "reports/ledger.sqlite")
+FINAL_AFTER_DAYS = int(os.environ.get("FINAL_AFTER_DAYS", "2") or "2")
 
-    # Best-effort: remove stale lock files from a mounted profile
-    cleanup_profile_locks(user_data_dir)
+# Progress checkpoint; `python app/ProjectManager.py --resume` (or RESUME=1) continues from it
+CHECKPOINT_FILE = os.environ.get("CHECKPOINT_FILE", "reports/project.checkpoint.json")
 
-    if headless:
-        options.add_argument("--headless=new")
-        options.add_argument("--disable-gpu")
+# Rows are written by a background thread in batches of CSV_FLUSH_ROWS or every CSV_FLUSH_INTERVAL seconds
+CSV_FLUSH_ROWS = int(os.environ.get("CSV_FLUSH_ROWS", "200") or "200")
+CSV_FLUSH_INTERVAL = float(os.environ.get("CSV_FLUSH_INTERVAL", "1") or "1")
 
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--window-size=1920,1080")
+# PARQUET_DIR=reports/parquet additionally writes a typed, month/city-partitioned Parquet dataset
+PARQUET_DIR = os.environ.get("PARQUET_DIR", "")
 
-    chrome_bin = os.environ.get("CHROME_BIN")
-    if chrome_bin:
-        options.binary_location = chrome_bin
-
-    driver_path = os.environ.get("CHROMEDRIVER")
-    if driver_path and Path(driver_path).exists():
-        service = Service(executable_path=driver_path)
-    else:
-        if ChromeDriverManager is None:
-            raise RuntimeError(
-                "Chromedriver not found and webdriver-manager is unavailable."
-            )
-        service = Service(ChromeDriverManager().install())
+# JSONL_OUT=- streams every value as a JSON line to stdout (logs move to stderr); or a file/FIFO path
+JSONL_OUT = os.environ.get("JSONL_OUT", "")
 
-    return webdriver.Chrome(service=service, options=options)
+# CLONE_PROFILE=1 runs Chrome on a throwaway copy of USER_DATA_DIR (always on
+# for workers); PROFILE_CLONE_DIR should sit on the same filesystem so hardlinks work
+PROFILE_CLONE_DIR = Path(os.environ["PROFILE_CLONE_DIR"]) if os.environ.get("PROFILE_CLONE_DIR") else None
 
 
 # =========================
 # Project Manager runner
 # =========================
 
-class ProjectManagerRunner:
+class ProjectManagerRunner(ReportEngine):
+    """Debiting report: the generic traversal plus the tab pool, direct HTTP
+    and Excel engines and the worker pool."""
+
     def __init__(
         self,
         driver: webdriver.Chrome,
@@ -117,398 +122,525 @@ class ProjectManagerRunner:
         csv_file: Path,
         wait_timeout: int = 25,
         slow_delay: float = 0.0,
+        tabs: int = 1,
+        engine: str = "browser",
+        direct_concurrency: int = 8,
+        cdp_capture: bool = False,
+        observer_wait: bool = False,
+        report_timeout: float = 10.0,
+        highlight: bool = True,
+        download_dir: Optional[Path] = None,
+        excel_timeout: float = 120.0,
+        ledger_path: Optional[Path] = None,
+        final_after_days: int = 2,
+        parquet_dir: Optional[Path] = None,
+        stream: Optional[JsonlStream] = None,
+        checkpoint: Optional[Checkpoint] = None,
+        resume: bool = False,
+        fast_switch: bool = False,
+        timer: Optional[PhaseTimer] = None,
     ) -> None:
-        self.driver = driver
+        super().__init__(
+            driver,
+            SPEC,
+            csv_file=csv_file,
+            wait_timeout=wait_timeout,
+            slow_delay=slow_delay,
+            cdp_capture=cdp_capture,
+            observer_wait=observer_wait,
+            report_timeout=report_timeout,
+            highlight=highlight,
+            ledger_path=ledger_path,
+            final_after_days=final_after_days,
+            parquet_dir=parquet_dir,
+            stream=stream,
+            checkpoint=checkpoint,
+            resume=resume,
+            csv_flush_rows=CSV_FLUSH_ROWS,
+            csv_flush_interval=CSV_FLUSH_INTERVAL,
+            fast_switch=fast_switch,
+            timer=timer,
+        )
         self.role_id = role_id
         self.select_department_url = select_department_url
         self.back_to_select_role_url = back_to_select_role_url
         self.report_url = report_url
-        self.csv_file = csv_file
-        self.wait = WebDriverWait(self.driver, wait_timeout)
-        self.slow_delay = slow_delay
-
-    # ---------- Navigation / auth ----------
-    def ensure_role_selected(self) -> None:
-        if "/SelectRole" in self.driver.current_url:
-            # Log available roles to help choose ROLE_ID
-            try:
-                roles = self.driver.execute_script(
-                    """
-                    return Array.from(document.querySelectorAll('[name="roleId"]'))
-                      .map(el => ({
-                        tag: el.tagName,
-                        type: el.getAttribute('type') || '',
-                        value: el.getAttribute('value') || '',
-                        text: (el.textContent||el.value||'').trim()
-                      }));
-                    """
-                ) or []
-                if roles:
-                    print("[role] Доступные роли:")
-                    for r in roles:
-                        print(f"[role] value={r.get('value')} text={r.get('text')}")
-            except Exception:
-                pass
-            try:
-                self.wait.until(
-                    EC.element_to_be_clickable(
-                        (By.CSS_SELECTOR, f'button[name="roleId"][value="{self.role_id}"]')
-                    )
-                ).click()
-            except Exception:
-                try:
-                    self.wait.until(
-                        EC.element_to_be_clickable(
-                            (By.CSS_SELECTOR, f'[name="roleId"][value="{self.role_id}"]')
-                        )
-                    ).click()
-                except Exception:
-                    pass
+        # Departments of one city are pipelined across this many tabs
+        self.tabs = max(1, int(tabs))
+        # "browser" drives the report page; "direct" replays the form over HTTP
+        self.engine = engine
+        self.direct_concurrency = direct_concurrency
+        # ENGINE=excel: where Chrome saves the export, and how long to wait for it
+        self.download_dir = download_dir
+        self.excel_timeout = excel_timeout
+
+    # ---------- Tab pool ----------
+    def open_report_tabs(self, count: int) -> List[str]:
+        # The current tab is already on the report page; open the rest next to it
+        handles = [self.driver.current_window_handle]
+        for _ in range(count - 1):
             try:
-                WebDriverWait(self.driver, 10).until(
-                    lambda d: "/SelectRole" not in d.current_url
-                )
-            except Exception:
-                pass
+                self.driver.switch_to.new_window("tab")
+                # A new tab is a new DevTools target: the block list is per target
+                if self.resources is not None:
+                    self.resources.attach_tab()
+                self.open_report()
+                self.apply_filters()
+                handles.append(self.driver.current_window_handle)
+            except Exception as e:
+                print(f"[WARN] Не удалось открыть вкладку: {e}")
+                break
+        self.driver.switch_to.window(handles[0])
+        return handles
 
-    def open_select_department(self) -> None:
-        self.driver.get(self.select_department_url)
-        self.ensure_role_selected()
-        if "/SelectDepartment" not in self.driver.current_url:
+    def close_report_tabs(self, handles: List[str]) -> None:
+        for handle in handles[1:]:
             try:
-                self.driver.get(self.select_department_url)
+                self.driver.switch_to.window(handle)
+                self.driver.close()
             except Exception:
                 pass
+        self.driver.switch_to.window(handles[0])
 
-    def back_to_select_role(self) -> None:
-        try:
-            self.driver.get(self.back_to_select_role_url)
-        except Exception:
-            pass
+    def collect_with_tabs(
+        self, departments: List[str], dates: List[dt.date]
+    ) -> Dict[str, List[Tuple[dt.date, str]]]:
+        """Build reports for several departments at once, one department per tab.
+
+        Tabs are driven round-robin: a tab whose report has not been replaced
+        yet is skipped until the next pass, so builds overlap on the server.
+        """
+        handles = self.open_report_tabs(min(self.tabs, len(departments)))
+        print(f"[TABS] Вкладок: {len(handles)}")
+        queue = list(departments)
+        results: Dict[str, List[Tuple[dt.date, str]]] = {dept: [] for dept in departments}
+        # Per tab: current department, remaining dates and the in-flight build
+        slots: Dict[str, dict] = {h: {"dept": None, "dates": [], "pending": None} for h in handles}
         try:
-            WebDriverWait(self.driver, 10).until(EC.url_contains("/SelectRole"))
-        except Exception:
-            pass
-        self.ensure_role_selected()
-        self.open_select_department()
-
-    # ---------- City/department helpers ----------
-    def get_cities(self) -> List[Tuple[str, str]]:
-        self.open_select_department()
-        print(f"[nav] Текущий URL: {self.driver.current_url}")
-        # Wait for city selectors; support multiple tag types
+            while slots:
+                progressed = False
+                for handle in list(slots):
+                    slot = slots[handle]
+                    self.driver.switch_to.window(handle)
+                    pending = slot["pending"]
+                    if pending is not None:
+                        d, armed, watching, deadline = pending
+                        if armed is not None:
+                            done = generation_done(self.driver, armed)
+                        else:
+                            done = watching and report_changed(self.driver)
+                        if done:
+                            val = self.read_total_value()
+                        elif armed is None and not watching:
+                            val = self.build_untracked(d)
+                        elif time.monotonic() < deadline:
+                            continue
+                        else:
+                            val = self.build_timed_out(d)
+                        results[slot["dept"]].append((d, val))
+                        print(f"[CSV] {slot['dept']} — {d:%d.%m.%Y}: {val}")
+                        slot["pending"] = None
+                        progressed = True
+                    if not slot["dates"]:
+                        if not queue:
+                            del slots[handle]
+                            continue
+                        slot["dept"] = queue.pop(0)
+                        slot["dates"] = list(dates)
+                        print(f"[DEPT] {slot['dept']} (вкладка {handles.index(handle) + 1})")
+                        self.choose_department(slot["dept"])
+                        if not slot["dates"]:
+                            continue
+                    d = slot["dates"].pop(0)
+                    self.set_period_dates(d)
+                    armed, watching = self.arm_build()
+                    self.click_build_report()
+                    slot["pending"] = (d, armed, watching, time.monotonic() + self.report_timeout)
+                    progressed = True
+                if not progressed:
+                    time.sleep(0.05)
+        finally:
+            self.close_report_tabs(handles)
+        return results
+
+    # ---------- Direct HTTP engine ----------
+    def capture_report_form(self) -> Optional[dict]:
         try:
-            self.wait.until(
-                EC.presence_of_all_elements_located((By.CSS_SELECTOR, '*[name="uuid"]'))
-            )
+            form = self.driver.execute_script(CAPTURE_FORM_JS)
         except Exception:
-            # Extra hint if stuck on role selection
-            if "/SelectRole" in self.driver.current_url:
-                print("[hint] Похоже, вы на странице выбора роли. Проверьте ROLE_ID.")
-            raise
-        try:
-            items = self.driver.execute_script(
-                """
-                return Array.from(document.querySelectorAll('*[name="uuid"]'))
-                  .map(b => ({
-                    name: (b.textContent || '').trim(),
-                    uuid: b.getAttribute('value') || b.getAttribute('data-value') || b.getAttribute('data-uuid') ||
-                          b.getAttribute('uuid') || b.getAttribute('data-id') || '',
-                  }))
-                  .filter(x => x.name && x.uuid);
-                """
-            ) or []
-        except Exception:
-            items = []
-        cities: List[Tuple[str, str]] = []
-        seen = set()
-        for it in items:
-            uuid = it.get("uuid")
-            name = it.get("name")
-            if uuid and name and uuid not in seen:
-                seen.add(uuid)
-                cities.append((name, uuid))
-        cities.sort(key=lambda x: x[0].lower())
-        if not cities:
-            raise RuntimeError("Не удалось получить список городов на SelectDepartment")
-        return cities
-
-    def select_city(self, city_uuid: str) -> None:
-        self.open_select_department()
-        self.ensure_role_selected()
-        self.wait.until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, f'button[name="uuid"][value="{city_uuid}"]'))
-        ).click()
-        time.sleep(0.2)
-
-    def get_departments(self, limit: Optional[int] = None) -> List[str]:
-        names: List[str] = []
-        # Try to read from real <select id="UnitId">
-        for _ in range(100):
-            try:
-                names = self.driver.execute_script(
-                    "return Array.from(document.querySelectorAll('#UnitId option'))\n"
-                    "  .map(o => (o.text||'').trim())\n"
-                    "  .filter(t => t && t.toLowerCase()!=='выбрать все');"
-                ) or []
-            except Exception:
-                names = []
-            if names:
-                break
-            time.sleep(0.1)
-        if not names:
-            # Fallback: attempt to open the dropdown and read items
-            try:
-                opened = self.driver.execute_script(
-                    "var s=document.getElementById('UnitId'); if(!s) return false;\n"
-                    "var box=s.closest('.select-report'); if(!box) return false;\n"
-                    "var cap=box.querySelector('.CaptionCont'); if(!cap) return false; cap.click(); return true;"
-                )
-                if opened:
-                    time.sleep(0.3)
-                names = self.driver.execute_script(
-                    "return Array.from(document.querySelectorAll('.open li'))\n"
-                    "  .map(li => (li.textContent||'').trim())\n"
-                    "  .filter(t => t && t.toLowerCase()!=='выбрать все');"
-                ) or []
-            except Exception:
-                names = []
-        if limit is not None:
-            names = names[: max(0, int(limit))]
-        return names
+            return None
+        return form if isinstance(form, dict) and form.get("action") else None
 
-    def force_select_only_one_by_text(self, dept_name: str) -> List[str]:
-        try:
-            selected = self.driver.execute_script(
-                """
-                var s=document.getElementById('UnitId');
-                if(!s) return [];
-                var name=arguments[0];
-                Array.from(s.options).forEach(o => o.selected=((o.text||'').trim()===name));
-                var e; try{e=new Event('change',{bubbles:true});}catch(err){e=document.createEvent('HTMLEvents'); e.initEvent('change',true,false);} s.dispatchEvent(e);
-                return Array.from(s.selectedOptions).map(o=>(o.text||'').trim());
-                """,
-                dept_name,
-            )
-            if isinstance(selected, list):
-                return [str(x) for x in selected]
-            return []
-        except Exception:
-            return []
+    def collect_direct(
+        self, departments: List[str], dates: List[dt.date]
+    ) -> Dict[str, List[Tuple[dt.date, str]]]:
+        """Fetch every (department, date) total over HTTP with the browser's cookies.
 
-    def choose_department(self, dept_name: str) -> None:
-        # Try up to 3 times to enforce a single selection
-        for _ in range(3):
-            chosen = self.force_select_only_one_by_text(dept_name)
-            if len(chosen) == 1 and chosen[0] == dept_name:
-                break
-            time.sleep(0.1)
-        # Align UI wrapper state (optional best-effort)
+        The browser is only used to serialize the report form per department;
+        cells the direct request could not fetch are rebuilt in the browser.
+        """
+        forms: Dict[str, dict] = {}
+        for dept in departments:
+            self.choose_department(dept)
+            form = self.capture_report_form()
+            if form:
+                forms[dept] = form
+            else:
+                print(f"[WARN] Форма отчёта не найдена для {dept} — будет использован браузер")
+        jobs = [(dept, forms[dept], d) for dept in departments if dept in forms for d in dates]
+        user_agent = next((f.get("userAgent") or "" for f in forms.values()), "")
+        client = DirectReportClient(
+            self.driver.get_cookies(),
+            self.spec.total_selectors,
+            user_agent=user_agent,
+            concurrency=self.direct_concurrency,
+        )
         try:
-            self.driver.execute_script(
-                """
-                var s=document.getElementById('UnitId'); if(!s) return;
-                var name=arguments[0];
-                var box=s.closest('.select-report'); if(!box) return;
-                var items=box.querySelectorAll('li');
-                items.forEach(li=>{
-                  var t=(li.textContent||'').trim();
-                  var sel=li.classList.contains('selected');
-                  if(t===name && !sel){ li.click(); }
-                  if(t!==name && sel){ li.click(); }
-                });
-                """,
-                dept_name,
-            )
-        except Exception:
-            pass
-
-    # ---------- Filters / report ----------
-    def compute_dates(self) -> List[dt.date]:
-        today = dt.date.today()
-        start = today.replace(day=1)
-        yesterday = today - dt.timedelta(days=1)
-        if yesterday < start:
-            return []
-        days = (yesterday - start).days + 1
-        return [start + dt.timedelta(days=i) for i in range(days)]
-
-    def set_period_dates(self, d: dt.date) -> None:
-        # For Project Manager: set StartDate/EndDate directly and dispatch events
-        start_s = d.strftime("%d.%m.%Y")
-        end_s = d.strftime("%d.%m.%Y")
-        js = """
-        function setVal(sel, val){
-          var el=document.querySelector(sel); if(!el) return false;
-          el.value=val;
-          try{ el.dispatchEvent(new Event('input',{bubbles:true})); }catch(e){ var ev=document.createEvent('HTMLEvents'); ev.initEvent('input',true,false); el.dispatchEvent(ev); }
-          try{ el.dispatchEvent(new Event('change',{bubbles:true})); }catch(e){ var ev2=document.createEvent('HTMLEvents'); ev2.initEvent('change',true,false); el.dispatchEvent(ev2); }
-          return true;
-        }
-        return [setVal('#StartDate', arguments[0]), setVal('#EndDate', arguments[1])];
+            with self.timer.span("direct_fetch"):
+                values = client.fetch_totals(jobs)
+        finally:
+            client.close()
+        print(f"[DIRECT] Запросов: {len(jobs)}")
+
+        results: Dict[str, List[Tuple[dt.date, str]]] = {}
+        for dept in departments:
+            chosen = False
+            rows: List[Tuple[dt.date, str]] = []
+            for d in dates:
+                val = values.get((dept, d))
+                if not isinstance(val, str):
+                    if val is not None:
+                        print(f"[WARN] {dept} — {d:%d.%m.%Y}: {val}; строю в браузере")
+                    if not chosen:
+                        self.choose_department(dept)
+                        chosen = True
+                    val = self.build(d)
+                rows.append((d, val))
+                print(f"[CSV] {dept} — {d:%d.%m.%Y}: {val}")
+            results[dept] = rows
+        return results
+
+    # ---------- In-page batch engine ----------
+    def fetch_batch(self, form: dict, dates: List[dt.date]) -> Dict[dt.date, object]:
+        """Totals of all ``dates`` from one execute_async_script; failures map to exceptions."""
+        by_text = {d.strftime(self.spec.date_format): d for d in dates}
+        rounds = -(-len(dates) // max(1, self.direct_concurrency))
+        self.driver.set_script_timeout(30 + self.report_timeout * rounds)
+        out = self.driver.execute_async_script(
+            BATCH_TOTALS_JS, form, list(by_text), self.spec.total_selectors, self.direct_concurrency
+        ) or {}
+        values: Dict[dt.date, object] = {}
+        for text, d in by_text.items():
+            item = out.get(text) or {"error": "нет ответа"}
+            values[d] = normalize_total(item["text"]) if "text" in item else RuntimeError(item.get("error"))
+        return values
+
+    def collect_batch(
+        self, departments: List[str], dates: List[dt.date]
+    ) -> Dict[str, List[Tuple[dt.date, str]]]:
+        """One WebDriver round trip per department instead of a build cycle per date.
+
+        The page fetches the report form for every date in parallel and reads
+        the totals itself; cells it could not fetch are rebuilt in the browser.
         """
+        results: Dict[str, List[Tuple[dt.date, str]]] = {}
+        for dept in departments:
+            self.choose_department(dept)
+            form = self.capture_report_form()
+            values: Dict[dt.date, object] = {}
+            if form:
+                try:
+                    with self.timer.span("batch_fetch"):
+                        values = self.fetch_batch(form, dates)
+                except Exception as e:
+                    print(f"[WARN] Пакетный запрос для {dept} не удался: {e}")
+            else:
+                print(f"[WARN] Форма отчёта не найдена для {dept} — будет использован браузер")
+            print(f"[BATCH] {dept}: {sum(isinstance(v, str) for v in values.values())} из {len(dates)} дн.")
+            rows: List[Tuple[dt.date, str]] = []
+            for d in dates:
+                val = values.get(d)
+                if not isinstance(val, str):
+                    if val is not None:
+                        print(f"[WARN] {dept} — {d:%d.%m.%Y}: {val}; строю в браузере")
+                    val = self.build(d)
+                rows.append((d, val))
+                print(f"[CSV] {dept} — {d:%d.%m.%Y}: {val}")
+            results[dept] = rows
+        return results
+
+    # ---------- Excel export engine ----------
+    def click_excel_export(self) -> None:
         try:
-            self.driver.execute_script(js, start_s, end_s)
+            btn = WebDriverWait(self.driver, 5).until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, EXCEL_BUTTON_SELECTOR))
+            )
+            btn.click()
         except Exception:
-            pass
-
-    def open_report(self) -> None:
-        self.driver.get(self.report_url)
-        self.ensure_role_selected()
-        # Some pages require a short delay for scripts to wire up
-        time.sleep(0.2)
-
-    def select_all_reasons(self) -> None:
-        # Select all options in DebitingReasonId if present (stabilizes totals)
-        try:
+            # PrepareExcelReport: a plain form submit returns the workbook
             self.driver.execute_script(
-                "var s=document.getElementById('DebitingReasonId'); if(!s) return;"
-                "Array.from(s.options).forEach(o=>o.selected=true);"
-                "try{s.dispatchEvent(new Event('change',{bubbles:true}));}catch(e){var ev=document.createEvent('HTMLEvents');ev.initEvent('change',true,false);s.dispatchEvent(ev);}"
+                "var el=document.querySelector('#StartDate'); var f=(el&&el.form)||document.querySelector('form');"
+                "if(f){ HTMLFormElement.prototype.submit.call(f); }"
             )
-        except Exception:
-            pass
 
-    def click_build_report(self) -> None:
-        try:
-            btn = self.wait.until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, '[name="reportButton"], #buildReportButton'))
-            )
+    def allow_downloads(self, target: Path) -> None:
+        for cmd in ("Browser.setDownloadBehavior", "Page.setDownloadBehavior"):
             try:
-                self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", btn)
+                self.driver.execute_cdp_cmd(cmd, {"behavior": "allow", "downloadPath": str(target)})
+                return
             except Exception:
-                pass
-            btn.click()
-        except Exception:
-            # Fallback: try JS entry points if exist
+                continue
+
+    def collect_excel(
+        self, departments: List[str], dates: List[dt.date]
+    ) -> Dict[str, List[Tuple[dt.date, str]]]:
+        """Download one Excel export for all departments and the whole range.
+
+        Raises if the file does not arrive or cannot be split by department,
+        so the caller can fall back to per-day builds.
+        """
+        if not dates:
+            return {dept: [] for dept in departments}
+        # Per-process subdirectory keeps WORKERS from picking up each other's files
+        target = (self.download_dir or Path(DOWNLOAD_DIR)).resolve() / f"pm-{os.getpid()}"
+        target.mkdir(parents=True, exist_ok=True)
+        self.allow_downloads(target)
+
+        self.select_all_departments()
+        self.set_period_dates(dates[0], dates[-1])
+        before = set(os.listdir(target))
+        with self.timer.span("excel_download"):
+            self.click_excel_export()
+            path = wait_for_download(target, before, timeout=self.excel_timeout)
+        if path is None:
+            raise RuntimeError(f"Выгрузка Excel не скачалась за {self.excel_timeout:.0f} с")
+        print(f"[EXCEL] {path.name} ({path.stat().st_size} байт)")
+        try:
+            with self.timer.span("excel_parse"):
+                totals = aggregate_daily_totals(iter_xlsx_rows(path))
+        finally:
             try:
-                self.driver.execute_script("if(window.buildReport){buildReport();}")
+                path.unlink()
             except Exception:
                 pass
 
-    def read_total_value(self) -> str:
-        # Prefer explicit total cells, then fallback to last numeric cell
-        selectors = [
-            "tbody td.totalValue",
-            "tfoot td",
-            "tbody tr:last-child td:last-child",
-            "tbody td",
-        ]
-        for sel in selectors:
-            try:
-                elems = self.driver.find_elements(By.CSS_SELECTOR, sel)
-            except Exception:
-                elems = []
-            if not elems:
-                continue
-            candidates = [e for e in elems if (e.text or "").strip() and any(c.isdigit() for c in e.text)]
-            if not candidates:
-                continue
-            target = candidates[-1]
-            try:
-                self.driver.execute_script(
-                    "arguments[0].style.backgroundColor='#00ff00';arguments[0].style.color='#000';",
-                    target,
+        names = {name for name, _d in totals}
+        if names == {""}:
+            if len(departments) != 1:
+                raise RuntimeError("В выгрузке нет колонки отдела — не разделить по отделам")
+            totals = {(departments[0], d): v for (_n, d), v in totals.items()}
+        else:
+            unknown = names - set(departments)
+            missing = [dept for dept in departments if dept not in names]
+            # Names that differ from the <select> texts would turn into silent zeros
+            if not names & set(departments) or (unknown and missing):
+                raise RuntimeError(
+                    f"Отделы выгрузки не совпадают со списком: нет {missing}, лишние {sorted(unknown)}"
                 )
-            except Exception:
-                pass
-            txt = (target.text or "").replace("\xa0", " ").strip()
-            # Normalize Russian currency formatting (spaces as thousands, comma or dot as decimal)
-            txt = txt.replace("₽", "").replace(" ", "")
-            return txt
-        return ""
-
-    # ---------- CSV ----------
-    def reset_csv(self) -> None:
-        with open(self.csv_file, "w", encoding="utf-8-sig", newline="") as f:
-            f.write("\ufeff")
-
-    def append_csv_row(self, row: List[str]) -> None:
-        with open(self.csv_file, "a", newline="", encoding="utf-8-sig") as f:
-            csv.writer(f, delimiter=";").writerow(row)
-
-    # ---------- Main flow ----------
-    def run(self) -> int:
-        self.open_select_department()
-        cities = self.get_cities()
-        print(f"[CITIES] Найдено: {len(cities)} — {', '.join([c[0] for c in cities])}")
-
-        dates = self.compute_dates()
-        print(
-            f"[DATES] Диапазон: {dates[0]:%d.%m.%Y} — {dates[-1]:%d.%m.%Y} (всего {len(dates)})"
-            if dates
-            else "[DATES] Сегодня 1-е — диапазон пуст"
-        )
+            if unknown:
+                print(f"[WARN] В выгрузке есть отделы не из списка: {sorted(unknown)}")
 
-        self.reset_csv()
+        results: Dict[str, List[Tuple[dt.date, str]]] = {}
+        for dept in departments:
+            results[dept] = [(d, format_amount(totals.get((dept, d), Decimal(0)))) for d in dates]
+            print(f"[CSV] {dept}: {len(dates)} дн. из Excel")
+        return results
 
-        for cidx, (city_name, city_uuid) in enumerate(cities, start=1):
-            print("\n" + "#" * 80)
-            print(f"[CITY] ({cidx}/{len(cities)}) {city_name}")
-            try:
-                self.select_city(city_uuid)
-                self.open_report()
-                self.select_all_reasons()
-
-                # Departments for this city
-                departments = self.get_departments(limit=None)
-                print(f"[DEPTS] {departments}")
-                self.append_csv_row([f"ГОРОД: {city_name}", ""])  # header
-
-                for didx, dept in enumerate(departments, start=1):
-                    print("\n" + "=" * 80)
-                    print(f"[DEPT] ({didx}/{len(departments)}) {dept}")
-                    self.choose_department(dept)
-                    self.append_csv_row([f"ОТДЕЛ: {dept}", ""])  # section
-
-                    for d in dates:
-                        self.set_period_dates(d)
-                        old_html = None
-                        try:
-                            old_html = self.driver.find_element(By.CSS_SELECTOR, "#report").get_attribute(
-                                "innerHTML"
-                            )
-                        except Exception:
-                            pass
-                        self.click_build_report()
-                        if old_html is not None:
-                            for _ in range(200):
-                                try:
-                                    if (
-                                        self.driver.find_element(By.CSS_SELECTOR, "#report").get_attribute(
-                                            "innerHTML"
-                                        )
-                                        != old_html
-                                    ):
-                                        break
-                                except Exception:
-                                    pass
-                                time.sleep(0.05)
-                        val = self.read_total_value()
-                        self.append_csv_row([d.strftime("%d.%m.%Y"), val])
-                        print(f"[CSV] {d:%d.%m.%Y}: {val}")
+    # ---------- Engine selection ----------
+    def collect_city(
+        self,
+        city_name: str,
+        departments: List[str],
+        dates: List[dt.date],
+        cached: Dict[Tuple[str, dt.date], str],
+    ) -> Optional[Dict[str, List[Tuple[dt.date, str]]]]:
+        # Only days that are neither final in the ledger nor checkpointed are fetched
+        todo = [
+            d
+            for d in dates
+            if any((dept, d) not in cached and not self.unit_done(city_name, f"val:{dept}:{d}") for dept in departments)
+        ]
+        if len(todo) != len(dates):
+            print(f"[LEDGER] К сбору {len(todo)} из {len(dates)} дн.")
 
+        if not todo:
+            return {}
+        if self.engine == "excel":
+            try:
+                return self.collect_excel(departments, todo)
             except Exception as e:
-                print(f"[WARN] Ошибка при обработке города {city_name}: {e}")
-                self.append_csv_row([f"ГОРОД: {city_name}", f"ОШИБКА: {e}"])
-                self.append_csv_row(["", ""])  # separator
+                print(f"[WARN] Excel-выгрузка не удалась ({e}); строю отчёты по дням")
+                self.open_report(force=True)
+                self.apply_filters()
+        elif self.engine == "direct":
+            return self.collect_direct(departments, todo)
+        elif self.engine == "batch":
+            return self.collect_batch(departments, todo)
+        if self.tabs > 1 and len(departments) > 1:
+            return self.collect_with_tabs(departments, todo)
+        return None
+
+    def runner_kwargs(self) -> dict:
+        return {
+            "role_id": self.role_id,
+            "select_department_url": self.select_department_url,
+            "back_to_select_role_url": self.back_to_select_role_url,
+            "report_url": self.report_url,
+            "csv_file": self.csv_file,
+            "wait_timeout": self.wait_timeout,
+            "slow_delay": self.slow_delay,
+            "tabs": self.tabs,
+            "engine": self.engine,
+            "direct_concurrency": self.direct_concurrency,
+            "cdp_capture": self.cdp_capture,
+            "observer_wait": self.observer_wait,
+            "report_timeout": self.report_timeout,
+            "highlight": self.highlight,
+            "download_dir": self.download_dir,
+            "excel_timeout": self.excel_timeout,
+            "ledger_path": self.ledger_path,
+            "final_after_days": self.final_after_days,
+            "parquet_dir": self.parquet_dir,
+            "fast_switch": self.fast_switch,
+            # Workers time their cities themselves and send the samples back with the rows
+            "timer": self.timer.fresh() if self.timer.enabled else None,
+        }
 
-            # Return to SelectRole between cities
-            try:
-                self.back_to_select_role()
-            except Exception:
-                pass
+    def run_parallel(self, workers: int, headless: bool, user_data_dir: Path) -> int:
+        cities, dates = self.prepare()
+        # Release the shared profile before workers clone it
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        # ...and the leased daemon Chrome, so a worker can take it
+        release_lease()
+
+        # Fork before the CSV writer thread starts and without the parent's SQLite
+        # connection: neither survives a fork. Workers open their own ledger.
+        if self.ledger is not None:
+            self.ledger.close()
+            self.ledger = None
+        workers = max(1, min(workers, len(cities)))
+        print(f"[POOL] Воркеров: {workers}")
+        pool = mp.Pool(
+            processes=workers,
+            initializer=_worker_init,
+            initargs=(headless, user_data_dir, self.runner_kwargs()),
+        )
+        try:
+            dates = self.start_output(dates)
+            tasks = [
+                (cidx, len(cities), name, uuid, dates)
+                for cidx, (name, uuid) in enumerate(cities, start=1)
+                if self.checkpoint is None or not self.checkpoint.city_done(name)
+            ]
+            # imap yields in submission order, so the merged CSV matches a sequential run
+            for task, (rows, timings) in zip(tasks, pool.imap(_worker_process_city, tasks)):
+                city_name = task[2]
+                self.timer.merge(timings)
+                # A city interrupted mid-way on a previous run restarts from its checkpointed rows
+                self.sink.write_many(rows[self.checkpointed_rows(city_name):])
+                self.finish_city(city_name)
+            pool.close()
+        except BaseException:
+            # Workers turn SIGTERM into SystemExit, so Chrome and profile clones are still cleaned up
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
 
+        self.finish_output()
         print(f"[DONE] Готово! Файл {self.csv_file} сохранён.")
+        self.print_summary()
         return 0
 
+    def checkpointed_rows(self, city_name: str) -> int:
+        if self.checkpoint is None:
+            return 0
+        current = self.checkpoint.state.get("current") or {}
+        return len(current.get("done", [])) if current.get("city") == city_name else 0
+
+
+def excel_download_dir() -> Optional[Path]:
+    # Managed download directory for the Excel export engine
+    return Path(DOWNLOAD_DIR) if ENGINE == "excel" else None
+
+
+# =========================
+# Worker pool (WORKERS=N)
+# =========================
+
+_worker_config: Optional[Tuple[bool, Path, dict]] = None
+_worker_runner: Optional[ProjectManagerRunner] = None
+
+
+def _worker_exit(signum, frame) -> None:
+    raise SystemExit(128 + signum)
+
+
+def _worker_init(headless: bool, user_data_dir: Path, runner_kwargs: dict) -> None:
+    global _worker_config
+    # The parent owns the checkpoint; workers must not flush its (forked, stale) copy.
+    # pool.terminate() sends SIGTERM: exit through SystemExit so the Finalize hooks
+    # (driver.quit, profile clone removal) run instead of leaving Chrome behind
+    signal.signal(signal.SIGTERM, _worker_exit)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_config = (headless, user_data_dir, runner_kwargs)
+
+
+def _get_worker_runner() -> ProjectManagerRunner:
+    # Chrome is started lazily so a launch failure is reported per city instead of crashing the pool
+    global _worker_runner
+    if _worker_runner is None:
+        assert _worker_config is not None
+        headless, user_data_dir, runner_kwargs = _worker_config
+        driver = build_chrome(
+            headless=headless,
+            # With SESSION_FILE build_chrome starts from an empty profile, with CHROME_DAEMON
+            # it attaches to a warm Chrome: nothing to clone
+            user_data_dir=user_data_dir
+            if session_file() or lease_browser()
+            else clone_profile(user_data_dir, PROFILE_CLONE_DIR or profile_tmpfs()),
+            download_dir=excel_download_dir(),
+        )
+        Finalize(None, driver.quit, exitpriority=10)
+        # Each worker opens its own stream; lines are flushed whole, so they do not interleave
+        stream = JsonlStream(JSONL_OUT) if JSONL_OUT else None
+        _worker_runner = ProjectManagerRunner(driver=driver, stream=stream, **runner_kwargs)
+    return _worker_runner
+
+
+def _worker_process_city(task: Tuple[int, int, str, str, List[dt.date]]) -> Tuple[List[List[str]], dict]:
+    cidx, total, city_name, city_uuid, dates = task
+    print(f"[CITY] ({cidx}/{total}) {city_name} — pid {os.getpid()}", flush=True)
+    try:
+        runner = _get_worker_runner()
+    except Exception as e:
+        print(f"[WARN] Воркер {os.getpid()} не смог запустить Chrome: {e}", flush=True)
+        return [[f"ГОРОД: {city_name}", f"ОШИБКА: {e}"], ["", ""]], {}
+    runner.row_buffer = []
+    try:
+        visited = runner.process_city(city_name, city_uuid, dates)
+        runner.flush_dataset(city_name)
+        if visited:
+            runner.leave_city()
+        runner.print_summary()
+        return runner.row_buffer, runner.timer.take()
+    finally:
+        runner.row_buffer = None
+
 
 def main() -> int:
+    # Opened first: with JSONL_OUT=- every later print goes to stderr
+    stream = JsonlStream(JSONL_OUT) if JSONL_OUT else None
+
     # Env/config
     user_data_dir = Path(os.environ.get("USER_DATA_DIR", "/profile"))
     user_data_dir.mkdir(parents=True, exist_ok=True)
 
     headless = env_bool("HEADLESS", True)
+    clone = env_bool("CLONE_PROFILE", False)
 
     # Use pinned defaults (no need to set env before running)
     role_id = ROLE_ID
@@ -522,6 +654,9 @@ def main() -> int:
     except Exception:
         pass
     slow_delay = SLOW_DELAY
+    resume = "--resume" in sys.argv[1:] or env_bool("RESUME", False)
+    checkpoint = Checkpoint(Path(CHECKPOINT_FILE), csv_file)
+    install_signal_handlers(checkpoint)
 
     print(
         f"[run] Chrome headless={headless}; profile={user_data_dir}; report_url={report_url}",
@@ -529,11 +664,21 @@ def main() -> int:
     )
 
     try:
-        driver = build_chrome(headless=headless, user_data_dir=user_data_dir)
+        chrome_profile_dir = user_data_dir
+        ram_dir = profile_tmpfs()
+        own_profile = session_file() is None and lease_browser() is None
+        if clone and WORKERS <= 1 and own_profile:
+            chrome_profile_dir = clone_profile(user_data_dir, PROFILE_CLONE_DIR or ram_dir)
+            print(f"[run] Профиль склонирован в {chrome_profile_dir}", flush=True)
+        elif ram_dir is not None and WORKERS <= 1 and own_profile:
+            chrome_profile_dir = stage_profile(user_data_dir, ram_dir)
+            print(f"[run] Профиль перенесён в RAM: {chrome_profile_dir}", flush=True)
+        driver = build_chrome(headless=headless, user_data_dir=chrome_profile_dir, download_dir=excel_download_dir())
     except Exception as e:
         print(f"[run] Failed to launch Chrome: {e}", file=sys.stderr)
         return 2
 
+    runner: Optional[ProjectManagerRunner] = None
     try:
         runner = ProjectManagerRunner(
             driver=driver,
@@ -544,9 +689,32 @@ def main() -> int:
             csv_file=csv_file,
             wait_timeout=25,
             slow_delay=slow_delay,
+            tabs=TABS,
+            engine=ENGINE,
+            direct_concurrency=DIRECT_CONCURRENCY,
+            cdp_capture=env_bool("CDP_CAPTURE", False),
+            observer_wait=env_bool("OBSERVER_WAIT", False),
+            report_timeout=REPORT_TIMEOUT,
+            highlight=env_bool("HIGHLIGHT", not headless),
+            download_dir=Path(DOWNLOAD_DIR),
+            excel_timeout=EXCEL_TIMEOUT,
+            ledger_path=Path(LEDGER_PATH) if env_bool("INCREMENTAL", False) else None,
+            final_after_days=FINAL_AFTER_DAYS,
+            parquet_dir=Path(PARQUET_DIR) if PARQUET_DIR else None,
+            stream=stream,
+            checkpoint=checkpoint,
+            resume=resume,
+            fast_switch=FAST_SWITCH,
+            timer=PhaseTimer.from_env(SPEC.name),
         )
+        if WORKERS > 1:
+            return runner.run_parallel(WORKERS, headless=headless, user_data_dir=user_data_dir)
         return runner.run()
     finally:
+        if runner is not None:
+            runner.close_output()
+        if stream is not None:
+            stream.close()
         try:
             driver.quit()
         except Exception:
@@ -0,0 +1,142 @@
+"""Chrome bootstrap shared by the report scripts."""
+
+import os
+from glob import glob
+from pathlib import Path
+from typing import Optional
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+from cdp_capture import enable_network_log
+from chrome_daemon import lease_browser
+from chrome_profile import empty_profile
+from chrome_startup import StartupTimer, chrome_binary, resolve_chromedriver
+from excel_export import chrome_download_prefs
+from resource_policy import ResourcePolicy
+from session_state import import_session, session_file
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    val = os.environ.get(name)
+    if val is None:
+        return default
+    return str(val).strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
+def cleanup_profile_locks(user_data_dir: Path) -> None:
+    try:
+        targets = []
+        for sub in (user_data_dir, user_data_dir / "Default"):
+            for pattern in ("Singleton*", "DevToolsActivePort"):
+                targets.extend(Path(p) for p in glob(str(sub / pattern)))
+        for p in targets:
+            try:
+                if p.is_file() or p.is_symlink():
+                    p.unlink(missing_ok=True)
+            except Exception:
+                pass
+    except Exception:
+        pass
+
+
+def chrome_service() -> Service:
+    # Local and cached first; webdriver-manager (network) only as a last resort
+    return Service(executable_path=resolve_chromedriver())
+
+
+def attach_chrome(address: str, cdp_capture: Optional[bool] = None) -> webdriver.Chrome:
+    """Drive an already running Chrome (``host:port`` of its remote debugging endpoint)."""
+    timer = StartupTimer()
+    options = Options()
+    options.add_experimental_option("debuggerAddress", address)
+    if env_bool("CDP_CAPTURE", False) if cdp_capture is None else cdp_capture:
+        enable_network_log(options)
+    # Launch flags do not apply to a running browser; the strategy and block list do
+    policy = ResourcePolicy.from_env()
+    if policy is not None:
+        policy.apply_options(options)
+    service = chrome_service()
+    timer.mark("chromedriver")
+    driver = webdriver.Chrome(service=service, options=options)
+    timer.mark("подключение к Chrome")
+    if policy is not None:
+        policy.attach(driver)
+        timer.mark("политика сети")
+    timer.report()
+    return driver
+
+
+def build_chrome(
+    headless: bool,
+    user_data_dir: Path,
+    download_dir: Optional[Path] = None,
+    cdp_capture: Optional[bool] = None,
+) -> webdriver.Chrome:
+    # CHROME_DAEMON: a warm Chrome of app/chrome_daemon.py, already authenticated
+    lease = lease_browser()
+    if lease is not None:
+        return attach_chrome(lease.address, cdp_capture)
+
+    timer = StartupTimer()
+    options = Options()
+
+    # SESSION_FILE: an empty throwaway profile plus the exported cookies/localStorage
+    session = session_file()
+    if session is not None:
+        clone_dir = os.environ.get("PROFILE_CLONE_DIR")
+        user_data_dir = empty_profile(Path(clone_dir) if clone_dir else None)
+
+    # Reuse existing authenticated profile
+    options.add_argument(f"--user-data-dir={str(user_data_dir)}")
+    (user_data_dir / "Default").mkdir(parents=True, exist_ok=True)
+
+    # Best-effort: remove stale lock files from a mounted profile
+    cleanup_profile_locks(user_data_dir)
+    timer.mark("профиль")
+
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--disable-gpu")
+
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--window-size=1920,1080")
+    # Keep background tabs running at full speed (tab pool drives several at once)
+    options.add_argument("--disable-background-timer-throttling")
+    options.add_argument("--disable-renderer-backgrounding")
+    options.add_argument("--disable-backgrounding-occluded-windows")
+
+    # Managed download directory for the Excel export engine
+    if download_dir is not None:
+        download_dir = Path(download_dir).resolve()
+        download_dir.mkdir(parents=True, exist_ok=True)
+        options.add_experimental_option("prefs", chrome_download_prefs(download_dir))
+
+    # Report completion through DevTools network events (see cdp_capture)
+    if env_bool("CDP_CAPTURE", False) if cdp_capture is None else cdp_capture:
+        enable_network_log(options)
+
+    # RESOURCE_POLICY=1: eager page loads, no images, blocked fonts/analytics (see resource_policy)
+    policy = ResourcePolicy.from_env()
+    if policy is not None:
+        policy.apply_options(options)
+
+    # The binary the chromedriver version was matched against
+    chrome_bin = chrome_binary()
+    if chrome_bin:
+        options.binary_location = chrome_bin
+
+    service = chrome_service()
+    timer.mark("chromedriver")
+    driver = webdriver.Chrome(service=service, options=options)
+    timer.mark("запуск Chrome")
+    if session is not None:
+        import_session(driver, session)
+        timer.mark("сессия")
+    if policy is not None:
+        policy.attach(driver)
+        timer.mark("политика сети")
+    timer.report()
+    return driver
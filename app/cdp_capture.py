@@ -0,0 +1,124 @@
+"""Report completion via Chrome DevTools network events.
+
+With ``CDP_CAPTURE=1`` Chrome is started with the performance log enabled
+(``goog:loggingPrefs``), so ``Network.responseReceived`` and
+``Network.loadingFinished`` events can be read after clicking the build
+button. Once the report XHR has finished its body is fetched with
+``Network.getResponseBody`` and parsed in Python, instead of shipping the
+whole ``#report`` innerHTML over the WebDriver wire every 50 ms.
+"""
+
+import base64
+import json
+import time
+import weakref
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+
+# Listeners per driver: reading the log drains it, so every reader goes
+# through read_performance_log() and listeners see all entries
+_log_listeners: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def enable_network_log(options) -> None:
+    """Turn on the Chrome performance log (network domain only) for ``options``."""
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
+
+
+def add_log_listener(driver, listener: Callable[[List[dict]], None]) -> None:
+    _log_listeners.setdefault(driver, []).append(listener)
+
+
+def read_performance_log(driver) -> List[dict]:
+    """Drain the performance log of ``driver`` and pass the entries to its listeners."""
+    entries = driver.get_log("performance")
+    for listener in _log_listeners.get(driver, ()):
+        try:
+            listener(entries)
+        except Exception:
+            pass
+    return entries
+
+
+class ReportResponseCapture:
+    """Waits for the report XHR triggered by a build click and returns its body.
+
+    ``url_filters`` are substrings; a request matches when its URL contains
+    any of them (case-insensitive). ``arm()`` can narrow one build to the
+    report endpoint; with neither, any XHR/Fetch to the page's host matches.
+    """
+
+    def __init__(self, driver, url_filters: Iterable[str] = ()) -> None:
+        self.driver = driver
+        self.url_filters = [f.lower() for f in url_filters if f]
+        # Endpoint of the build in flight (set by arm())
+        self.target: Optional[str] = None
+        self.enabled = False
+        try:
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            read_performance_log(self.driver)
+            self.enabled = True
+        except Exception as e:
+            print(f"[CDP] Перехват сети недоступен: {e}")
+
+    def arm(self, target: Optional[str] = None) -> None:
+        """Start a build; ``target`` is a URL substring of its request (e.g. the form action path)."""
+        self.target = target.lower() if target else None
+        # Discard events from before the click (page scripts, previous builds)
+        if self.enabled:
+            try:
+                read_performance_log(self.driver)
+            except Exception:
+                pass
+
+    def _matches(self, url: str) -> bool:
+        filters = [self.target] if self.target else self.url_filters
+        if filters:
+            return any(f in url.lower() for f in filters)
+        try:
+            return urlparse(url).netloc == urlparse(self.driver.current_url).netloc
+        except Exception:
+            return False
+
+    def wait_body(self, timeout: float = 10.0) -> Optional[str]:
+        """Return the body of the first matching XHR that finishes, or None on timeout."""
+        if not self.enabled:
+            return None
+        pending: Dict[str, str] = {}
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                entries = read_performance_log(self.driver)
+            except Exception:
+                return None
+            for entry in entries:
+                try:
+                    msg = json.loads(entry["message"])["message"]
+                except Exception:
+                    continue
+                method = msg.get("method")
+                params = msg.get("params") or {}
+                if method == "Network.responseReceived":
+                    if params.get("type") not in ("XHR", "Fetch"):
+                        continue
+                    url = (params.get("response") or {}).get("url", "")
+                    if self._matches(url):
+                        pending[params.get("requestId")] = url
+                elif method == "Network.loadingFinished" and params.get("requestId") in pending:
+                    return self._body(params["requestId"])
+                elif method == "Network.loadingFailed" and params.get("requestId") in pending:
+                    pending.pop(params["requestId"], None)
+            time.sleep(0.02)
+        return None
+
+    def _body(self, request_id: str) -> Optional[str]:
+        try:
+            res = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+        except Exception:
+            return None
+        body = res.get("body") or ""
+        if res.get("base64Encoded"):
+            body = base64.b64decode(body).decode("utf-8", errors="replace")
+        return body
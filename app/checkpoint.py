@@ -0,0 +1,172 @@
+"""Crash-safe checkpoint for long runs.
+
+After every completed unit (a city header, a department section, one
+date's value) the runner calls ``commit()``: the checkpoint records which
+units of the current city are done, which cities are finished and the size
+of the CSV at that moment, and is replaced atomically (write + rename).
+
+On ``--resume`` the CSV is truncated back to the recorded size (dropping a
+half-written tail), finished cities and units are skipped and the run
+continues with the same date range. ``install_signal_handlers()`` makes
+SIGTERM/SIGINT flush the last committed state before exiting.
+
+When rows go through the buffered ``CsvSink``, ``mark()``/``commit()`` are
+called from its writer thread with the size of the fsynced file, so the
+checkpoint never points past data that is not on disk yet.
+"""
+
+import datetime as dt
+import json
+import os
+import signal
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+
+class Checkpoint:
+    def __init__(self, path: Path, csv_file: Path) -> None:
+        self.path = Path(path)
+        self.csv_file = Path(csv_file)
+        self.state: dict = {}
+        self.pending: List[str] = []
+        self.pending_offset: Optional[int] = None
+        self._done_cities: set = set()
+        self._done_units: set = set()
+        self._lock = threading.RLock()
+
+    # ---------- Lifecycle ----------
+    def start(self, dates: List[dt.date], resume: bool) -> Optional[List[dt.date]]:
+        """Begin a run. With ``resume`` and a usable checkpoint, truncate the
+        CSV to the last committed size and return the checkpointed dates;
+        otherwise start fresh and return None."""
+        if resume:
+            state = self._load()
+            if state and state.get("csv_file") == str(self.csv_file) and self.csv_file.exists():
+                self.state = state
+                self._done_cities = set(state.get("cities_done", []))
+                self._done_units = set((state.get("current") or {}).get("done", []))
+                with open(self.csv_file, "r+b") as f:
+                    f.truncate(int(state.get("offset", 0)))
+                print(
+                    f"[RESUME] Продолжаю с контрольной точки: городов готово {len(self._done_cities)}, "
+                    f"CSV обрезан до {state.get('offset', 0)} байт"
+                )
+                return [dt.date.fromisoformat(x) for x in state.get("dates", [])]
+            print("[RESUME] Контрольная точка не найдена или не подходит — начинаю заново")
+        self.state = {
+            "csv_file": str(self.csv_file),
+            "dates": [d.isoformat() for d in dates],
+            "cities_done": [],
+            "current": None,
+            "offset": 0,
+        }
+        return None
+
+    def finish(self) -> None:
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    # ---------- Units ----------
+    def city_done(self, city: str) -> bool:
+        return city in self._done_cities
+
+    def unit_done(self, city: str, key: str) -> bool:
+        with self._lock:
+            current = self.state.get("current") or {}
+            return current.get("city") == city and key in self._done_units
+
+    def city_started(self, city: str) -> bool:
+        """True if the run was interrupted inside ``city`` after some units were committed."""
+        with self._lock:
+            current = self.state.get("current") or {}
+            return current.get("city") == city and bool(self._done_units)
+
+    def mark(self, city: str, key: str, offset: Optional[int] = None) -> None:
+        """Record a unit whose rows have been handed to the CSV; saved on the next commit().
+
+        ``offset`` is the CSV size right after the unit's rows, when known.
+        """
+        with self._lock:
+            self.pending_offset = offset
+            current = self.state.get("current")
+            if not current or current.get("city") != city:
+                self.state["current"] = {"city": city, "done": []}
+                self._done_units = set()
+            self.pending.append(key)
+
+    def commit(self, offset: Optional[int] = None) -> None:
+        """Save marked units; ``offset`` is the durable CSV size (default: the
+        offset of the last mark(), else the current file size)."""
+        with self._lock:
+            current = self.state.get("current")
+            if current is not None and self.pending:
+                current["done"].extend(self.pending)
+                self._done_units.update(self.pending)
+            self.pending = []
+            if offset is None:
+                offset = self.pending_offset
+            self.pending_offset = None
+            if offset is None:
+                try:
+                    offset = self.csv_file.stat().st_size
+                except OSError:
+                    offset = 0
+            self.state["offset"] = offset
+            self.flush()
+
+    def commit_marked(self) -> None:
+        """commit() if anything was marked since the last one (CsvSink ``on_flush`` hook)."""
+        with self._lock:
+            if self.pending:
+                self.commit()
+
+    def finish_city(self, city: str, offset: Optional[int] = None) -> None:
+        with self._lock:
+            self.pending = []
+            self.pending_offset = None
+            self._done_cities.add(city)
+            self.state.setdefault("cities_done", []).append(city)
+            self.state["current"] = None
+            self._done_units = set()
+            self.commit(offset)
+
+    # ---------- Storage ----------
+    def flush(self) -> None:
+        """Atomically write the last committed state."""
+        with self._lock:
+            if not self.state:
+                return
+            self.state["updated_at"] = dt.datetime.now().isoformat(timespec="seconds")
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def _load(self) -> Optional[dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def install_signal_handlers(*checkpoints: Checkpoint) -> None:
+    """Flush the checkpoints and exit on SIGTERM (docker stop) and SIGINT."""
+
+    def handler(signum, _frame):
+        try:
+            for checkpoint in checkpoints:
+                checkpoint.flush()
+        finally:
+            print(f"[STOP] Сигнал {signum}: контрольная точка сохранена, перезапуск с --resume")
+            raise SystemExit(128 + signum)
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            signal.signal(sig, handler)
+        except (ValueError, OSError):
+            pass
@@ -0,0 +1,366 @@
+"""Warm Chrome instances that report runs attach to instead of starting Chrome.
+
+    CHROME_DAEMON=1 python app/chrome_daemon.py 2
+
+keeps N Chrome processes running with ``--remote-debugging-port`` (from
+``CHROME_DAEMON_PORT``, default 9230), each on its own profile: the
+authenticated ``USER_DATA_DIR`` itself for one instance (staged in RAM with
+PROFILE_TMPFS), clones of it for several, or an empty profile plus the
+SESSION_FILE state. Every instance is warmed once — the app page is loaded
+so the login redirect, caches and the DevTools connection are already paid
+for — and then health-checked every ``HEALTH_INTERVAL`` seconds: a dead
+Chrome is restarted, an idle one is reloaded every ``WARM_INTERVAL`` seconds
+to keep the session alive and to notice when it has expired.
+
+The instances are described by ``<port>.json`` files in the daemon
+directory (``CHROME_DAEMON``: ``1`` for /tmp/chrome-daemon or a path). A run
+with the same ``CHROME_DAEMON`` leases a healthy instance by taking an
+exclusive ``flock`` on ``<port>.lock`` and attaches chromedriver through
+``debuggerAddress``; the lock is released when the run's process exits,
+whatever the way. With no free instance the run starts its own Chrome as
+before.
+"""
+
+import datetime as dt
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore
+
+from chrome_startup import chrome_binary
+
+DEFAULT_DIR = Path("/tmp/chrome-daemon")
+WARM_URL = "https://officemanager.dodopizza.ru/Infrastructure/Authenticate/BackToSelectRole"
+
+
+def daemon_dir() -> Optional[Path]:
+    """CHROME_DAEMON: ``1`` for /tmp/chrome-daemon, a path for another directory."""
+    raw = os.environ.get("CHROME_DAEMON", "").strip()
+    if not raw or raw == "0":
+        return None
+    return DEFAULT_DIR if raw == "1" else Path(raw)
+
+
+def devtools_version(port: int, timeout: float = 2.0) -> Optional[dict]:
+    """``/json/version`` of the Chrome listening on ``port``, None if it does not answer."""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/json/version", timeout=timeout) as r:
+            return json.loads(r.read().decode("utf-8"))
+    except Exception:
+        return None
+
+
+def _try_lock(path: Path) -> Optional[int]:
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _unlock(fd: int) -> None:
+    try:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+class Lease:
+    """A daemon instance held by this process until it exits."""
+
+    def __init__(self, port: int, fd: int, state: dict) -> None:
+        self.port = port
+        self.fd = fd
+        self.state = state
+        self.pid = os.getpid()
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self.port}"
+
+
+_lease: Optional[Lease] = None
+_lease_pid: Optional[int] = None
+
+
+def lease_browser() -> Optional[Lease]:
+    """A warm daemon Chrome for this process, or None (CHROME_DAEMON unset or nothing free).
+
+    The answer is remembered per process: callers ask before preparing a
+    profile and build_chrome asks again when it starts the driver.
+    """
+    global _lease, _lease_pid
+    # Forked workers inherit the parent's answer; each process leases its own
+    if _lease_pid == os.getpid():
+        return _lease
+    _lease, _lease_pid = None, os.getpid()
+    root = daemon_dir()
+    if root is None or fcntl is None:
+        return None
+    for state_file in sorted(root.glob("*.json")):
+        try:
+            state = json.loads(state_file.read_text("utf-8"))
+            port = int(state["port"])
+        except Exception:
+            continue
+        if state.get("status") != "ok":
+            continue
+        fd = _try_lock(root / f"{port}.lock")
+        if fd is None:
+            continue
+        if devtools_version(port) is None:
+            _unlock(fd)
+            continue
+        _lease = Lease(port, fd, state)
+        print(f"[DAEMON] Подключаюсь к прогретому Chrome на порту {port} (профиль {state.get('user_data_dir')})")
+        return _lease
+    print(f"[DAEMON] Свободных прогретых Chrome в {root} нет — запускаю свой")
+    return None
+
+
+def release_lease() -> None:
+    """Give this process's instance back (after its driver quit), e.g. to a worker.
+
+    Call it before forking workers: a child that inherits the locked fd would
+    keep the instance held. The process does not lease again afterwards.
+    """
+    global _lease
+    if _lease is not None and _lease_pid == os.getpid():
+        _unlock(_lease.fd)
+        print(f"[DAEMON] Chrome на порту {_lease.port} освобождён")
+    _lease = None
+
+
+# ---------- Daemon ----------
+
+def _chrome_binary() -> str:
+    path = chrome_binary()
+    if path is None:
+        raise RuntimeError("Chrome не найден: задайте CHROME_BIN")
+    return path
+
+
+class Instance:
+    """One Chrome process of the daemon and its state file."""
+
+    def __init__(self, root: Path, port: int, user_data_dir: Path, headless: bool) -> None:
+        self.root = root
+        self.port = port
+        self.user_data_dir = user_data_dir
+        self.headless = headless
+        self.proc: Optional[subprocess.Popen] = None
+        self.status = "starting"
+        self.started: Optional[str] = None
+        self.warmed = 0.0
+        self.restarts = 0
+        self.session_imported = False
+
+    @property
+    def state_file(self) -> Path:
+        return self.root / f"{self.port}.json"
+
+    @property
+    def lock_file(self) -> Path:
+        return self.root / f"{self.port}.lock"
+
+    def write_state(self) -> None:
+        state = {
+            "port": self.port,
+            "pid": self.proc.pid if self.proc else None,
+            "user_data_dir": str(self.user_data_dir),
+            "status": self.status,
+            "started": self.started,
+            "checked": dt.datetime.now().isoformat(timespec="seconds"),
+            "restarts": self.restarts,
+        }
+        tmp = self.state_file.with_name(self.state_file.name + ".tmp")
+        tmp.write_text(json.dumps(state), "utf-8")
+        os.replace(tmp, self.state_file)
+
+    def start(self) -> None:
+        from browser import cleanup_profile_locks
+
+        cleanup_profile_locks(self.user_data_dir)
+        args = [
+            _chrome_binary(),
+            f"--remote-debugging-port={self.port}",
+            f"--user-data-dir={self.user_data_dir}",
+            "--no-first-run",
+            "--no-default-browser-check",
+            "--no-sandbox",
+            "--disable-dev-shm-usage",
+            "--window-size=1920,1080",
+            "--disable-background-timer-throttling",
+            "--disable-renderer-backgrounding",
+            "--disable-backgrounding-occluded-windows",
+        ]
+        if self.headless:
+            args += ["--headless=new", "--disable-gpu"]
+        args.append("about:blank")
+        self.proc = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.started = dt.datetime.now().isoformat(timespec="seconds")
+        self.status = "starting"
+        self.session_imported = False
+        self.warmed = 0.0
+        deadline = time.monotonic() + 30
+        while devtools_version(self.port, timeout=1) is None:
+            if self.proc.poll() is not None or time.monotonic() > deadline:
+                self.status = "dead"
+                self.write_state()
+                raise RuntimeError(f"Chrome на порту {self.port} не запустился")
+            time.sleep(0.2)
+        self.write_state()
+        print(f"[DAEMON] Chrome запущен: порт {self.port}, pid {self.proc.pid}, профиль {self.user_data_dir}")
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None and devtools_version(self.port) is not None
+
+    def warm(self, url: str, session: Optional[Path]) -> None:
+        """Attach once, load the app page and record whether the session is still valid."""
+        from browser import attach_chrome
+        from session_state import import_session
+
+        driver = attach_chrome(f"127.0.0.1:{self.port}")
+        try:
+            if session is not None and not self.session_imported:
+                import_session(driver, session)
+                self.session_imported = True
+            # Tabs left by the previous run
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.get(url)
+            app_host = urlsplit(url).netloc
+            here = urlsplit(driver.current_url or "").netloc
+            self.status = "ok" if here == app_host else "login"
+        finally:
+            # Attached through debuggerAddress: quit only ends the chromedriver session
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        self.warmed = time.monotonic()
+        self.write_state()
+        if self.status == "login":
+            print(f"[DAEMON] Порт {self.port}: сессия истекла (страница входа) — нужна повторная авторизация")
+
+    def stop(self) -> None:
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        for path in (self.state_file, self.lock_file):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def _profiles(count: int, session: Optional[Path]) -> List[Path]:
+    from chrome_profile import clone_profile, empty_profile, profile_tmpfs
+
+    user_data_dir = Path(os.environ.get("USER_DATA_DIR", "/profile"))
+    clone_dir = os.environ.get("PROFILE_CLONE_DIR")
+    base = Path(clone_dir) if clone_dir else profile_tmpfs()
+    if session is not None:
+        return [empty_profile(base) for _ in range(count)]
+    # Never USER_DATA_DIR itself, even for one instance: a run that finds the
+    # instance busy starts its own Chrome there (clearing its Singleton locks)
+    return [clone_profile(user_data_dir, base) for _ in range(count)]
+
+
+def check(instances: List[Instance], url: str, session: Optional[Path], warm_interval: float) -> None:
+    """One health pass: restart dead instances and warm idle ones that are due."""
+    for inst in instances:
+        # A leased instance belongs to its run: not even a dead one is touched until it exits
+        fd = _try_lock(inst.lock_file)
+        if fd is None:
+            continue
+        try:
+            if not inst.alive():
+                print(f"[DAEMON] Chrome на порту {inst.port} не отвечает — перезапуск")
+                inst.stop()
+                inst.restarts += 1
+                inst.start()
+            if inst.status != "ok" or time.monotonic() - inst.warmed >= warm_interval:
+                inst.warm(url, session)
+            else:
+                inst.write_state()
+        except Exception as e:
+            inst.status = "error"
+            inst.write_state()
+            print(f"[DAEMON] Порт {inst.port}: {e}")
+        finally:
+            _unlock(fd)
+
+
+def main(argv) -> int:
+    from browser import env_bool
+    from session_state import session_file
+
+    root = daemon_dir()
+    if root is None:
+        print("Использование: CHROME_DAEMON=1 python app/chrome_daemon.py [число Chrome]", file=sys.stderr)
+        return 2
+    if fcntl is None:
+        print("[DAEMON] Нужен Linux (fcntl.flock)", file=sys.stderr)
+        return 2
+    count = int(argv[0] if argv else os.environ.get("CHROME_DAEMON_INSTANCES", "1"))
+    base_port = int(os.environ.get("CHROME_DAEMON_PORT", "9230"))
+    health_interval = float(os.environ.get("HEALTH_INTERVAL", "30") or "30")
+    warm_interval = float(os.environ.get("WARM_INTERVAL", "600") or "600")
+    url = os.environ.get("WARM_URL", WARM_URL)
+    headless = env_bool("HEADLESS", True)
+    session = session_file()
+
+    root.mkdir(parents=True, exist_ok=True)
+    # SIGTERM (docker stop) takes the same way out as Ctrl+C: Chrome is stopped before profiles are written back
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    instances: List[Instance] = []
+    try:
+        for i, profile in enumerate(_profiles(count, session)):
+            inst = Instance(root, base_port + i, profile, headless)
+            instances.append(inst)
+            try:
+                inst.start()
+            except Exception as e:
+                # Restarted by the health check
+                print(f"[DAEMON] {e}")
+        print(f"[DAEMON] Chrome: {count}; каталог {root}; проверка каждые {health_interval:.0f} с")
+        while True:
+            check(instances, url, session, warm_interval)
+            states: Dict[str, int] = {}
+            for inst in instances:
+                states[inst.status] = states.get(inst.status, 0) + 1
+            print(f"[DAEMON] Состояние: {', '.join(f'{k} {v}' for k, v in sorted(states.items()))}", flush=True)
+            time.sleep(health_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for inst in instances:
+            inst.stop()
+        print("[DAEMON] Остановлен")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,186 @@
+"""Throwaway copies of an authenticated Chrome profile.
+
+Chrome locks its ``--user-data-dir``, so parallel browsers cannot share
+``/profile``. ``clone_profile()`` builds a private copy in a temp dir:
+files Chrome rewrites in place (SQLite databases, LevelDB logs, JSON state)
+are copied (reflinked where the filesystem supports it), everything else is
+hardlinked. Caches and lock files are skipped. Clones are removed on exit.
+"""
+
+import os
+import shutil
+import tempfile
+from multiprocessing.util import Finalize
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore
+
+
+# Linux FICLONE ioctl (copy-on-write clone on btrfs/xfs/overlayfs-on-xfs)
+FICLONE = 0x40049409
+
+# Not needed for an authenticated session and rebuilt by Chrome on demand
+SKIP_DIRS = {
+    "Cache",
+    "Code Cache",
+    "GPUCache",
+    "DawnGraphiteCache",
+    "DawnWebGPUCache",
+    "GrShaderCache",
+    "GraphiteDawnCache",
+    "ShaderCache",
+    "component_crx_cache",
+    "Crashpad",
+}
+SKIP_FILES = {"DevToolsActivePort", "SingletonLock", "SingletonCookie", "SingletonSocket", "RunningChromeVersion"}
+
+# Immutable LevelDB tables: safe to share between clones via hardlinks
+SHARED_SUFFIXES = (".ldb",)
+
+# What a RAM-staged profile writes back on a clean exit: the authenticated
+# session (cookies, storage, prefs), not caches or history
+SESSION_STATE = (
+    "Local State",
+    "Default/Cookies",
+    "Default/Cookies-journal",
+    "Default/Network/Cookies",
+    "Default/Network/Cookies-journal",
+    "Default/Local Storage",
+    "Default/Session Storage",
+    "Default/IndexedDB",
+    "Default/Preferences",
+    "Default/Secure Preferences",
+)
+
+
+def _is_profile_dir(name: str) -> bool:
+    return name == "Default" or name.startswith("Profile ") or name == "Guest Profile"
+
+
+def _reflink_or_copy(src: Path, dst: Path) -> None:
+    if fcntl is not None:
+        try:
+            with open(src, "rb") as fs, open(dst, "wb") as fd:
+                fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+            shutil.copystat(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        _reflink_or_copy(src, dst)
+
+
+def _clone_tree(src: Path, dst: Path, private: bool, top: bool = False) -> None:
+    dst.mkdir(parents=True, exist_ok=True)
+    with os.scandir(src) as it:
+        for entry in it:
+            if entry.name in SKIP_FILES or entry.name in SKIP_DIRS:
+                continue
+            s = Path(entry.path)
+            d = dst / entry.name
+            try:
+                if entry.is_symlink():
+                    os.symlink(os.readlink(s), d)
+                elif entry.is_dir():
+                    _clone_tree(s, d, private or _is_profile_dir(entry.name))
+                elif (private or top) and not entry.name.endswith(SHARED_SUFFIXES):
+                    # Top-level files ("Local State", ...) and profile data are written by Chrome
+                    _reflink_or_copy(s, d)
+                else:
+                    _link_or_copy(s, d)
+            except OSError:
+                # Unreadable entries (e.g. sockets) are not worth failing the clone
+                pass
+
+
+def clone_profile(user_data_dir: Path, base_dir: Optional[Path] = None) -> Path:
+    """Create a private copy of ``user_data_dir`` and return its path.
+
+    The copy lives in a fresh temp dir (under ``base_dir`` when given,
+    ideally on the same filesystem so hardlinks work) and is deleted when
+    the current process exits.
+    """
+    root = Path(tempfile.mkdtemp(prefix="chrome-profile-", dir=str(base_dir) if base_dir else None))
+    dest = root / "profile"
+    _clone_tree(Path(user_data_dir), dest, private=False, top=True)
+    Finalize(None, remove_clone, args=(dest,), exitpriority=0)
+    return dest
+
+
+def remove_clone(clone_dir: Path) -> None:
+    """Delete a directory returned by ``clone_profile()``."""
+    shutil.rmtree(Path(clone_dir).parent, ignore_errors=True)
+
+
+def empty_profile(base_dir: Optional[Path] = None) -> Path:
+    """A fresh, empty ``--user-data-dir`` (for SESSION_FILE startups), deleted at exit."""
+    root = Path(tempfile.mkdtemp(prefix="chrome-profile-", dir=str(base_dir) if base_dir else None))
+    dest = root / "profile"
+    dest.mkdir()
+    Finalize(None, remove_clone, args=(dest,), exitpriority=0)
+    return dest
+
+
+def stage_profile(user_data_dir: Path, ram_dir: Path) -> Path:
+    """Copy ``user_data_dir`` into ``ram_dir`` (a tmpfs) and return the copy.
+
+    Chrome then reads and writes only RAM. On a clean exit of the current
+    process the ``SESSION_STATE`` files are written back to the original
+    profile (after the driver has quit) and the copy is removed.
+    """
+    ram_dir = Path(ram_dir)
+    ram_dir.mkdir(parents=True, exist_ok=True)
+    root = Path(tempfile.mkdtemp(prefix="chrome-ram-", dir=str(ram_dir)))
+    dest = root / "profile"
+    # Everything is copied: hardlinks cannot cross into the tmpfs anyway
+    _clone_tree(Path(user_data_dir), dest, private=True, top=True)
+    Finalize(None, remove_clone, args=(dest,), exitpriority=0)
+    Finalize(None, write_back_session, args=(dest, Path(user_data_dir)), exitpriority=5)
+    return dest
+
+
+def write_back_session(staged: Path, user_data_dir: Path) -> None:
+    """Copy the session files of a staged profile back; each entry is replaced atomically."""
+    written = 0
+    for rel in SESSION_STATE:
+        src = staged / rel
+        if not src.exists():
+            continue
+        dst = user_data_dir / rel
+        tmp = dst.with_name(dst.name + ".writeback")
+        try:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if src.is_dir():
+                shutil.rmtree(tmp, ignore_errors=True)
+                shutil.copytree(src, tmp)
+                old = dst.with_name(dst.name + ".old")
+                shutil.rmtree(old, ignore_errors=True)
+                if dst.exists():
+                    os.replace(dst, old)
+                os.replace(tmp, dst)
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                shutil.copy2(src, tmp)
+                os.replace(tmp, dst)
+            written += 1
+        except OSError as e:
+            print(f"[PROFILE] {rel} не записан обратно: {e}")
+    print(f"[PROFILE] Сессия записана обратно в {user_data_dir} ({written} элементов)")
+
+
+def profile_tmpfs() -> Optional[Path]:
+    """PROFILE_TMPFS: ``1`` stages the profile in /dev/shm, a path stages it there."""
+    raw = os.environ.get("PROFILE_TMPFS", "").strip()
+    if not raw or raw == "0":
+        return None
+    return Path("/dev/shm") if raw == "1" else Path(raw)
@@ -0,0 +1,201 @@
+"""Chrome startup: chromedriver resolution and phase timing.
+
+``resolve_chromedriver()`` uses ``CHROMEDRIVER`` as given (a version
+mismatch only warns; a missing file fails). Otherwise it picks a
+chromedriver whose major version matches the Chrome binary, from (in order)
+``PATH``, the Debian chromium paths and drivers webdriver-manager downloaded
+earlier. A verified
+match is cached in ``CHROMEDRIVER_CACHE`` (default ``reports/chromedriver.json``)
+together with a fingerprint (path, size, mtime) of both binaries: while
+neither changes, the next start reuses it without running any ``--version``.
+A mismatched fallback is used for one run only and never cached.
+webdriver-manager is imported only when nothing local matches (it goes to
+the network); ``CHROMEDRIVER_DOWNLOAD=0`` forbids that in offline containers.
+
+``StartupTimer`` prints how long each startup phase took (``[START]``).
+"""
+
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+DEBIAN_DRIVERS = (
+    "/usr/bin/chromedriver",
+    "/usr/lib/chromium/chromedriver",
+    "/usr/lib/chromium-browser/chromedriver",
+    "/snap/bin/chromium.chromedriver",
+)
+CHROME_NAMES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser")
+
+_VERSION_RE = re.compile(r"(\d+)\.\d+\.\d+\.\d+")
+
+
+def chrome_binary() -> Optional[str]:
+    """CHROME_BIN, or the first Chrome/Chromium on PATH."""
+    chrome_bin = os.environ.get("CHROME_BIN")
+    if chrome_bin:
+        return chrome_bin
+    for name in CHROME_NAMES:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def binary_version(path: str) -> Optional[str]:
+    """``x.y.z.w`` reported by ``path --version``, None if it cannot be run."""
+    try:
+        out = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=10).stdout
+    except Exception:
+        return None
+    m = _VERSION_RE.search(out or "")
+    return m.group(0) if m else None
+
+
+def _major(version: Optional[str]) -> Optional[str]:
+    return version.split(".", 1)[0] if version else None
+
+
+def fingerprint(path: Optional[str]) -> Optional[str]:
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.realpath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _candidates() -> List[str]:
+    found: List[str] = []
+    on_path = shutil.which("chromedriver")
+    # Drivers downloaded by webdriver-manager before, newest version first
+    wdm = sorted(
+        glob.glob(os.path.expanduser("~/.wdm/drivers/chromedriver/**/chromedriver"), recursive=True),
+        reverse=True,
+    )
+    for path in [on_path, *DEBIAN_DRIVERS, *wdm]:
+        if path and os.path.isfile(path) and os.access(path, os.X_OK) and path not in found:
+            found.append(path)
+    return found
+
+
+def _cache_file() -> Path:
+    return Path(os.environ.get("CHROMEDRIVER_CACHE", "reports/chromedriver.json"))
+
+
+def _read_cache(chrome: Optional[str]) -> Optional[str]:
+    try:
+        cached = json.loads(_cache_file().read_text("utf-8"))
+    except Exception:
+        return None
+    driver = cached.get("driver")
+    # A different CHROMEDRIVER means a new resolution
+    if cached.get("chromedriver_env") != os.environ.get("CHROMEDRIVER"):
+        return None
+    if cached.get("chrome_fingerprint") != fingerprint(chrome) or cached.get("driver_fingerprint") != fingerprint(driver):
+        return None
+    return driver
+
+
+def _write_cache(chrome: Optional[str], chrome_version: Optional[str], driver: str, driver_version: Optional[str]) -> None:
+    state = {
+        "chrome": chrome,
+        "chrome_version": chrome_version,
+        "chrome_fingerprint": fingerprint(chrome),
+        "driver": driver,
+        "driver_version": driver_version,
+        "driver_fingerprint": fingerprint(driver),
+        "chromedriver_env": os.environ.get("CHROMEDRIVER"),
+    }
+    path = _cache_file()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(state, indent=1), "utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def _download() -> Optional[str]:
+    if os.environ.get("CHROMEDRIVER_DOWNLOAD", "1") == "0":
+        return None
+    try:
+        # Imported only here: it pulls requests and goes to the network
+        from webdriver_manager.chrome import ChromeDriverManager  # type: ignore
+    except Exception:
+        return None
+    print("[START] Подходящего chromedriver нет локально — загрузка через webdriver-manager")
+    try:
+        return ChromeDriverManager().install()
+    except Exception as e:
+        print(f"[START] webdriver-manager: {e}")
+        return None
+
+
+def _pinned_driver(path: str, chrome: Optional[str], chrome_version: Optional[str]) -> str:
+    # The user's choice: never replaced by another driver
+    if not (os.path.isfile(path) and os.access(path, os.X_OK)):
+        raise RuntimeError(f"CHROMEDRIVER={path}: файл не найден или не исполняемый")
+    version = binary_version(path)
+    if chrome_version is not None and _major(version) != _major(chrome_version):
+        # Not cached: the warning is repeated on every start
+        print(f"[START] CHROMEDRIVER {version} не совпадает с Chrome {chrome_version} по версии — использую как задан: {path}")
+        return path
+    _write_cache(chrome, chrome_version, path, version)
+    print(f"[START] chromedriver {version} ({path}, CHROMEDRIVER) для Chrome {chrome_version} ({chrome})")
+    return path
+
+
+def resolve_chromedriver() -> str:
+    """Path of a chromedriver compatible with the Chrome binary; cached between runs."""
+    chrome = chrome_binary()
+    cached = _read_cache(chrome)
+    if cached:
+        return cached
+
+    chrome_version = binary_version(chrome) if chrome else None
+    pinned = os.environ.get("CHROMEDRIVER")
+    if pinned:
+        return _pinned_driver(pinned, chrome, chrome_version)
+    candidates: List[Tuple[str, Optional[str]]] = [(p, binary_version(p)) for p in _candidates()]
+    match = next((c for c in candidates if chrome_version is None or _major(c[1]) == _major(chrome_version)), None)
+    if match is None:
+        downloaded = _download()
+        if downloaded:
+            match = (downloaded, binary_version(downloaded))
+    if match is None:
+        if not candidates:
+            raise RuntimeError("chromedriver не найден (PATH, /usr/lib/chromium) и не загружен")
+        driver, driver_version = candidates[0]
+        # Not cached: the next start looks again (a matching driver may be installed by then)
+        print(f"[START] chromedriver {driver_version} не совпадает с Chrome {chrome_version} по версии — пробую {driver}")
+        return driver
+    driver, driver_version = match
+    _write_cache(chrome, chrome_version, driver, driver_version)
+    print(f"[START] chromedriver {driver_version} ({driver}) для Chrome {chrome_version} ({chrome}) — сохранено в {_cache_file()}")
+    return driver
+
+
+class StartupTimer:
+    """Wall time of consecutive startup phases, printed as one ``[START]`` line."""
+
+    def __init__(self) -> None:
+        self.start = self.last = time.monotonic()
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        now = time.monotonic()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self) -> None:
+        parts = [f"{name} {seconds:.2f} с" for name, seconds in self.phases]
+        print(f"[START] {'; '.join(parts)}; всего {time.monotonic() - self.start:.2f} с", flush=True)
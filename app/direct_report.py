@@ -0,0 +1,175 @@
+"""Direct HTTP engine for the Debiting report.
+
+Instead of clicking ``reportButton`` and polling ``#report`` through
+WebDriver, the report form is serialized once in the browser and then
+replayed with plain HTTP requests that carry the Chrome session cookies.
+The returned HTML fragment is parsed in Python (see ``report_html``).
+
+Everything here depends only on the standard library and ``urllib3``
+(installed with selenium), so it can be pointed at a local stand-in server
+(see ``tests/test_direct_report.py``).
+"""
+
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Sequence, Tuple
+from urllib.parse import urlencode
+
+import urllib3
+
+from report_html import parse_total
+
+
+# Serializes the form that owns #StartDate the way a submit via reportButton would
+CAPTURE_FORM_JS = """
+var start=document.querySelector('#StartDate');
+var end=document.querySelector('#EndDate');
+var f=(start && start.form) || document.querySelector('#report') && document.querySelector('#report').closest('form') || document.querySelector('form');
+if(!f) return null;
+var pairs=[];
+new FormData(f).forEach(function(v,k){ if(typeof v==='string') pairs.push([k,v]); });
+var b=f.querySelector('[name="reportButton"]');
+if(b && b.name) pairs.push([b.name, b.value||'']);
+return {
+  action: f.getAttribute('action') ? f.action : location.href,
+  method: (f.getAttribute('method')||'post').toUpperCase(),
+  startName: start ? (start.name||'StartDate') : 'StartDate',
+  endName: end ? (end.name||'EndDate') : 'EndDate',
+  fields: pairs,
+  userAgent: navigator.userAgent,
+  referer: location.href
+};
+"""
+
+# ENGINE=batch: replays the captured form for every date from inside the page,
+# at most arguments[3] requests at a time, and reads the total with the same
+# selectors as read_total_value(). Resolves to {date: {text} | {error}}.
+BATCH_TOTALS_JS = """
+var form = arguments[0], dates = arguments[1], selectors = arguments[2];
+var limit = Math.max(1, arguments[3] | 0), done = arguments[arguments.length - 1];
+var out = {}, next = 0;
+function params(d) {
+  var p = new URLSearchParams();
+  form.fields.forEach(function (kv) { if (kv[0] !== form.startName && kv[0] !== form.endName) p.append(kv[0], kv[1]); });
+  p.append(form.startName, d);
+  p.append(form.endName, d);
+  return p;
+}
+function total(html) {
+  var doc = new DOMParser().parseFromString(html, 'text/html');
+  for (var i = 0; i < selectors.length; i++) {
+    var found = Array.from(doc.querySelectorAll(selectors[i]))
+      .map(function (td) { return (td.textContent || '').replace(/\\s+/g, ' ').trim(); })
+      .filter(function (t) { return t && /\\d/.test(t); });
+    if (found.length) return found[found.length - 1];
+  }
+  return '';
+}
+function one(d) {
+  var url = form.action, opts = {method: form.method, credentials: 'same-origin', redirect: 'manual',
+                                  headers: {'X-Requested-With': 'XMLHttpRequest'}};
+  if (form.method === 'GET') url += (url.indexOf('?') < 0 ? '?' : '&') + params(d);
+  else opts.body = params(d);
+  return fetch(url, opts).then(function (r) {
+    // A redirect means the session was sent to login/role selection
+    if (r.type === 'opaqueredirect' || r.status !== 200) throw new Error('HTTP ' + (r.status || 'redirect'));
+    return r.text();
+  }).then(function (html) { out[d] = {text: total(html)}; }, function (e) { out[d] = {error: String(e)}; });
+}
+function worker() { return next < dates.length ? one(dates[next++]).then(worker) : null; }
+var workers = [];
+for (var i = 0; i < Math.min(limit, dates.length); i++) workers.push(worker());
+Promise.all(workers).then(function () { done(out); });
+"""
+
+
+class SessionRejected(RuntimeError):
+    """The server redirected to login/role selection instead of returning a report."""
+
+
+def cookie_header(cookies: Iterable[dict]) -> str:
+    """Build a Cookie header from ``driver.get_cookies()`` output."""
+    return "; ".join(f"{c['name']}={c['value']}" for c in cookies if c.get("name"))
+
+
+class DirectReportClient:
+    """Replays the captured report form over a pooled keep-alive HTTP session."""
+
+    def __init__(
+        self,
+        cookies: Iterable[dict],
+        total_selectors: Sequence[str],
+        user_agent: str = "",
+        concurrency: int = 8,
+        timeout: float = 30.0,
+        retries: int = 2,
+    ) -> None:
+        self.concurrency = max(1, int(concurrency))
+        # The spec's extract.selectors, as read_total_value() uses them in the browser
+        self.total_selectors = list(total_selectors)
+        headers = {
+            "Cookie": cookie_header(cookies),
+            "X-Requested-With": "XMLHttpRequest",
+            "Accept": "text/html, */*; q=0.01",
+        }
+        if user_agent:
+            headers["User-Agent"] = user_agent
+        # Sent with every request: urllib3 replaces pool-level headers when a request passes its own
+        self.headers = headers
+        self.http = urllib3.PoolManager(
+            num_pools=4,
+            maxsize=self.concurrency,
+            block=True,
+            timeout=urllib3.Timeout(connect=10.0, read=timeout),
+            retries=urllib3.Retry(total=retries, redirect=False, backoff_factor=0.2),
+        )
+
+    def fetch_html(self, form: dict, d: dt.date) -> str:
+        date_s = d.strftime("%d.%m.%Y")
+        fields: List[Tuple[str, str]] = []
+        for name, value in form["fields"]:
+            if name in (form["startName"], form["endName"]):
+                continue
+            fields.append((name, value))
+        fields.append((form["startName"], date_s))
+        fields.append((form["endName"], date_s))
+        body = urlencode(fields)
+        headers = dict(self.headers, Referer=form.get("referer") or form["action"])
+        if form.get("method", "POST") == "GET":
+            sep = "&" if "?" in form["action"] else "?"
+            resp = self.http.request("GET", form["action"] + sep + body, headers=headers, redirect=False)
+        else:
+            headers["Content-Type"] = "application/x-www-form-urlencoded; charset=UTF-8"
+            resp = self.http.request("POST", form["action"], body=body, headers=headers, redirect=False)
+        if 300 <= resp.status < 400:
+            raise SessionRejected(f"HTTP {resp.status} → {resp.headers.get('Location', '')}")
+        if resp.status != 200:
+            raise RuntimeError(f"HTTP {resp.status} от {form['action']}")
+        return resp.data.decode("utf-8", errors="replace")
+
+    def fetch_total(self, form: dict, d: dt.date) -> str:
+        return parse_total(self.fetch_html(form, d), self.total_selectors)
+
+    def fetch_totals(
+        self, jobs: Sequence[Tuple[str, dict, dt.date]]
+    ) -> Dict[Tuple[str, dt.date], object]:
+        """Run ``(key, form, date)`` jobs concurrently.
+
+        Returns ``{(key, date): total}``; a failed job maps to its exception
+        so the caller can fall back to the browser for just that cell.
+        """
+
+        def one(job: Tuple[str, dict, dt.date]) -> object:
+            _key, form, d = job
+            try:
+                return self.fetch_total(form, d)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            values = list(pool.map(one, jobs))
+        return {(key, d): val for (key, _form, d), val in zip(jobs, values)}
+
+    def close(self) -> None:
+        self.http.clear()
+
@@ -0,0 +1,76 @@
+"""JSON Lines stream of collected values.
+
+With ``JSONL_OUT`` set, every value (ProjectManager) or table row
+(OfficeManager) is emitted as one JSON object per line the moment it is
+read, so a downstream loader can ingest while the run is still going::
+
+    {"report": "project", "city": "...", "department": "...", "date": "2026-10-01", "total": 144263.94}
+
+``JSONL_OUT=-`` writes to stdout; the scripts' log output is then moved to
+stderr so stdout carries records only. Any other value is a file path or a
+named pipe (opening a FIFO waits for its reader). Lines are flushed one by
+one and are short, so worker processes sharing the target do not interleave.
+"""
+
+import datetime as dt
+import json
+import sys
+from decimal import Decimal
+from typing import List, Optional, Sequence, Tuple
+
+from excel_export import to_decimal
+
+
+def _number(value: Optional[Decimal]) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+class JsonlStream:
+    def __init__(self, target: str) -> None:
+        self.target = target
+        if target == "-":
+            # sys.__stdout__ is the real stdout even in forked workers, where
+            # sys.stdout has already been pointed at stderr by the parent
+            self.file = sys.__stdout__
+            sys.stdout = sys.stderr
+        else:
+            self.file = open(target, "a", encoding="utf-8")
+
+    def emit(self, record: dict) -> None:
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def emit_total(self, report: str, city: str, department: str, d: dt.date, value: str, scale: int = 2) -> None:
+        self.emit(
+            {
+                "report": report,
+                "city": city,
+                "department": department,
+                "date": d.isoformat(),
+                "total": _number(to_decimal(value, scale)),
+            }
+        )
+
+    def emit_table_rows(
+        self,
+        report: str,
+        city: str,
+        department: str,
+        d: dt.date,
+        rows: List[Tuple[str, List[str]]],
+        columns: Sequence[str],
+        scale: int = 3,
+    ) -> None:
+        """One record per row; the values are keyed by the spec's ``extract.columns``."""
+        for category, values in rows:
+            record = {"report": report, "city": city, "department": department, "date": d.isoformat(), "category": category}
+            for name, value in zip(columns, list(values) + [""] * len(columns)):
+                record[name] = _number(to_decimal(value, scale))
+            self.emit(record)
+
+    def close(self) -> None:
+        if self.file is not sys.__stdout__:
+            try:
+                self.file.close()
+            except Exception:
+                pass
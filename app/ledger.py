@@ -0,0 +1,91 @@
+"""Persistent ledger of already-collected report days (SQLite).
+
+Keyed by ``(report, city, department, date)``. A value is *final* when it
+was collected after the day had aged ``final_after_days`` days; final values
+are reused on later runs, everything else is fetched again. The ledger also
+remembers each city's department list, so a city whose days are all final
+does not have to be visited at all. CSV files are regenerated from it.
+"""
+
+import datetime as dt
+import json
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_values (
+    report TEXT NOT NULL,
+    city TEXT NOT NULL,
+    department TEXT NOT NULL,
+    day TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    final INTEGER NOT NULL,
+    collected_at TEXT NOT NULL,
+    PRIMARY KEY (report, city, department, day)
+);
+CREATE TABLE IF NOT EXISTS city_departments (
+    report TEXT NOT NULL,
+    city TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    department TEXT NOT NULL,
+    PRIMARY KEY (report, city, position)
+);
+"""
+
+
+class Ledger:
+    def __init__(self, path: Path, final_after_days: int = 2) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.final_after_days = final_after_days
+        # Several WORKERS processes share the file: WAL + generous busy timeout
+        self.conn = sqlite3.connect(str(self.path), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def is_final(self, d: dt.date) -> bool:
+        return d <= dt.date.today() - dt.timedelta(days=self.final_after_days)
+
+    # ---------- Values ----------
+    def final_values(self, report: str, city: str) -> Dict[Tuple[str, dt.date], Any]:
+        cur = self.conn.execute(
+            "SELECT department, day, payload FROM report_values WHERE report=? AND city=? AND final=1",
+            (report, city),
+        )
+        return {(dept, dt.date.fromisoformat(day)): json.loads(payload) for dept, day, payload in cur}
+
+    def put_many(self, report: str, city: str, items: Iterable[Tuple[str, dt.date, Any]]) -> None:
+        now = dt.datetime.now().isoformat(timespec="seconds")
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO report_values VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (report, city, dept, d.isoformat(), json.dumps(payload, ensure_ascii=False), int(self.is_final(d)), now)
+                    for dept, d, payload in items
+                ],
+            )
+
+    # ---------- Departments ----------
+    def departments(self, report: str, city: str) -> List[str]:
+        cur = self.conn.execute(
+            "SELECT department FROM city_departments WHERE report=? AND city=? ORDER BY position",
+            (report, city),
+        )
+        return [row[0] for row in cur]
+
+    def set_departments(self, report: str, city: str, departments: List[str]) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM city_departments WHERE report=? AND city=?", (report, city))
+            self.conn.executemany(
+                "INSERT INTO city_departments VALUES (?, ?, ?, ?)",
+                [(report, city, i, dept) for i, dept in enumerate(departments)],
+            )
+
+    def close(self) -> None:
+        try:
+            self.conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,95 @@
+"""Navigation state of one browser session.
+
+The officemanager flow is a chain of full page loads: SelectRole ->
+SelectDepartment -> city -> report page, and back. ``Navigator`` remembers
+which role and city the session has picked (set by the engine's own clicks,
+dropped whenever a load lands on SelectRole or the login host) and which
+page was last loaded under that state. A ``get`` whose target page is
+already shown under the same role and city is skipped.
+
+Role and city are not readable from the session cookie (it is opaque and
+httpOnly), so the state comes from the URL the browser reports and from the
+actions performed through the navigator.
+"""
+
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+
+def _norm(url: str) -> str:
+    # Scheme, host and path decide the page; ASP.NET routes are case-insensitive
+    parts = urlsplit(url or "")
+    return f"{parts.scheme}://{parts.netloc.lower()}{parts.path.rstrip('/').lower()}"
+
+
+class Navigator:
+    def __init__(self, driver, app_host: Optional[str] = None) -> None:
+        self.driver = driver
+        # Pages outside this host (the SSO login) mean the session state is gone
+        self.app_host = app_host
+        self.role: Optional[str] = None
+        self.city: Optional[str] = None
+        # (page, role, city) of the page currently shown, as last loaded or reached
+        self.loaded: Optional[Tuple[str, Optional[str], Optional[str]]] = None
+        self.loads = 0
+        self.saved = 0
+        self.direct = 0
+
+    def here(self) -> str:
+        try:
+            return self.driver.current_url or ""
+        except Exception:
+            return ""
+
+    def reached(self, url: str) -> bool:
+        """True if ``url`` is shown and was reached under the current role and city."""
+        target = _norm(url)
+        return _norm(self.here()) == target and self.loaded == (target, self.role, self.city)
+
+    def get(self, url: str, force: bool = False) -> bool:
+        """Load ``url`` unless it is already reached; returns whether a load happened."""
+        if not force and self.reached(url):
+            self.saved += 1
+            return False
+        self.driver.get(url)
+        self.loads += 1
+        self.settled()
+        return True
+
+    def settled(self) -> None:
+        """Record the page now shown as reached under the current role and city."""
+        url = self.here()
+        parts = urlsplit(url)
+        if "/selectrole" in parts.path.lower() or (self.app_host and parts.netloc and parts.netloc != self.app_host):
+            self.role = None
+            self.city = None
+        self.loaded = (_norm(url), self.role, self.city)
+
+    def role_selected(self, role_id: str) -> None:
+        # Picking a role starts over at SelectDepartment without a city
+        self.role = role_id
+        self.city = None
+        self.settled()
+
+    def city_selected(self, city_uuid: str) -> None:
+        self.city = city_uuid
+        self.settled()
+
+    def switched(self, city_uuid: str) -> None:
+        """City changed by an in-page request: the page shown still belongs to the old city."""
+        self.city = city_uuid
+        self.loaded = None
+        self.direct += 1
+
+    def has_city(self, role_id: str, city_uuid: str) -> bool:
+        return self.role == role_id and self.city == city_uuid
+
+    def skip(self) -> None:
+        """Count a navigation step skipped by the caller because its state is reached."""
+        self.saved += 1
+
+    def summary(self) -> str:
+        return (
+            f"[NAV] Загрузок страниц: {self.loads}; пропущено лишних переходов: {self.saved}; "
+            f"прямых смен города: {self.direct}"
+        )
@@ -0,0 +1,145 @@
+"""Typed Parquet output next to the CSV files.
+
+Values are parsed once at collection time into a real schema (``date32``
+dates, ``decimal128`` amounts, an explicit department column) built from
+the report spec (``extract.columns`` name the value cells of table rows,
+``extract.scale`` is the number of decimal places) and written as a
+Hive-partitioned dataset::
+
+    <root>/<report>/month=2026-10/city=<city>/part-0.parquet
+
+The city is not stored in the files: the ``city`` partition supplies it.
+Characters that cannot appear in a directory name are %-escaped, which
+hive partitioning (``segment_encoding="uri"``, the default) decodes back.
+
+Each city's partition is rewritten when the city is finished; rows already
+in the partition are kept unless the same key was collected again, so
+resumed and incremental runs do not lose days they skipped. Readers can
+load a whole year with ``pyarrow.dataset.dataset(root, partitioning="hive")``
+without re-parsing text.
+
+Requires ``pyarrow``; without it ``ParquetDataset`` raises on creation and
+the scripts keep writing CSV only.
+"""
+
+import datetime as dt
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from excel_export import to_decimal
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except Exception:  # pragma: no cover
+    pa = None  # type: ignore
+    pq = None  # type: ignore
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("pyarrow не установлен — Parquet-вывод недоступен")
+
+
+def total_schema(scale: int = 2):
+    _require_pyarrow()
+    return pa.schema(
+        [
+            ("department", pa.string()),
+            ("date", pa.date32()),
+            ("total", pa.decimal128(18, scale)),
+        ]
+    )
+
+
+def table_schema(columns: Sequence[str], scale: int = 3):
+    _require_pyarrow()
+    return pa.schema(
+        [
+            ("department", pa.string()),
+            ("date", pa.date32()),
+            ("category", pa.string()),
+        ]
+        + [(name, pa.decimal128(18, scale)) for name in columns]
+    )
+
+
+def _partition_value(text: str) -> str:
+    # Keep Cyrillic and spaces; %-escape path separators, '=' (Hive key/value split)
+    # and '%' itself so that URI decoding gives back the exact city name
+    return re.sub(r"[%\\/=:\x00]", lambda m: "%{:02X}".format(ord(m.group(0))), text) or "%20"
+
+
+class ParquetDataset:
+    """Buffers typed rows per city and writes them as one partition per month."""
+
+    def __init__(
+        self,
+        root: Path,
+        report: str,
+        schema,
+        key_columns: Sequence[str],
+        columns: Sequence[str] = (),
+        scale: int = 2,
+    ) -> None:
+        _require_pyarrow()
+        self.root = Path(root) / report
+        self.schema = schema
+        self.key_columns = list(key_columns)
+        # Value columns of table rows and the decimal scale of amounts
+        self.columns = list(columns)
+        self.scale = scale
+        self.pending: Dict[str, List[dict]] = defaultdict(list)
+
+    @classmethod
+    def for_spec(cls, root: Path, spec) -> "ParquetDataset":
+        """Dataset for a report spec: ``total`` -> one total column, ``table`` -> the spec's value columns."""
+        if spec.kind == "table":
+            schema, keys = table_schema(spec.columns, spec.scale), ("department", "date", "category")
+        else:
+            schema, keys = total_schema(spec.scale), ("department", "date")
+        return cls(root, spec.name, schema, keys, spec.columns, spec.scale)
+
+    # ---------- Rows ----------
+    def add_total(self, city: str, department: str, d: dt.date, value: str) -> None:
+        self.pending[city].append({"department": department, "date": d, "total": to_decimal(value, self.scale)})
+
+    def add_table_rows(self, city: str, department: str, d: dt.date, rows: List[Tuple[str, List[str]]]) -> None:
+        for category, values in rows:
+            row = {"department": department, "date": d, "category": category}
+            for name, value in zip(self.columns, list(values) + [""] * len(self.columns)):
+                row[name] = to_decimal(value, self.scale)
+            self.pending[city].append(row)
+
+    # ---------- Partitions ----------
+    def partition_path(self, month: str, city: str) -> Path:
+        return self.root / f"month={month}" / f"city={_partition_value(city)}" / "part-0.parquet"
+
+    def flush_city(self, city: str) -> None:
+        rows = self.pending.pop(city, [])
+        by_month: Dict[str, List[dict]] = defaultdict(list)
+        for row in rows:
+            by_month[row["date"].strftime("%Y-%m")].append(row)
+        for month, month_rows in by_month.items():
+            self._write_partition(self.partition_path(month, city), month_rows)
+
+    def _write_partition(self, path: Path, rows: List[dict]) -> None:
+        table = pa.Table.from_pylist(rows, schema=self.schema)
+        if path.exists():
+            try:
+                old = pq.read_table(path, schema=self.schema)
+                fresh = {tuple(r[c] for c in self.key_columns) for r in rows}
+                keep = [r for r in old.to_pylist() if tuple(r[c] for c in self.key_columns) not in fresh]
+                if keep:
+                    table = pa.concat_tables([pa.Table.from_pylist(keep, schema=self.schema), table])
+            except Exception as e:
+                print(f"[PARQUET] Не удалось прочитать {path}, файл будет перезаписан: {e}")
+        table = table.sort_by([(c, "ascending") for c in self.key_columns])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Dot-prefixed, so dataset discovery ignores a leftover from a crash
+        tmp = path.with_name("." + path.name + ".tmp")
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
@@ -0,0 +1,218 @@
+"""Per-phase timing of a report run.
+
+``PhaseTimer.span(phase)`` wraps a runner phase (role selection, city
+switch, report page load, department choice, report build, value read, CSV
+write…). Spans nest: the time of an outer phase includes its inner ones.
+A span opened with ``city=`` attributes every span inside it to that city.
+
+At the end of the run (``write()``) the timer writes a JSON summary with
+count / total / p50 / p95 / max per phase and per-city totals, and a
+Prometheus textfile for node-exporter's textfile collector. Both files are
+replaced atomically.
+
+``TIMINGS=1`` enables it (``PhaseTimer.from_env``). Disabled, ``span()``
+returns one shared no-op context manager and records nothing. ``@timed``
+wraps a whole method of an object with a ``timer`` attribute.
+"""
+
+import datetime as dt
+import functools
+import json
+import math
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+_NULL_SPAN = nullcontext()
+
+
+def _quantile(values: List[float], q: float) -> float:
+    # Nearest rank on the sorted samples
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, "utf-8")
+    os.replace(tmp, path)
+
+
+def timed(phase: str):
+    """Method decorator: run the method inside ``self.timer.span(phase)``."""
+
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.timer.enabled:
+                return method(self, *args, **kwargs)
+            with self.timer.span(phase):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+class PhaseTimer:
+    def __init__(
+        self,
+        report: str,
+        json_file: Optional[Path] = None,
+        textfile: Optional[Path] = None,
+        enabled: bool = True,
+    ) -> None:
+        self.report = report
+        self.json_file = json_file
+        self.textfile = textfile
+        self.enabled = enabled
+        self.samples: Dict[str, List[float]] = {}
+        # city -> phase -> seconds; the "city" phase is the city's wall time
+        self.cities: Dict[str, Dict[str, float]] = {}
+        self.city: Optional[str] = None
+        self.started = time.time()
+
+    @classmethod
+    def from_env(cls, report: str) -> Optional["PhaseTimer"]:
+        """The timer configured by TIMINGS / TIMINGS_DIR / TIMINGS_TEXTFILE, or None."""
+        if os.environ.get("TIMINGS", "0").strip().lower() not in ("1", "true", "yes", "on"):
+            return None
+        out_dir = Path(os.environ.get("TIMINGS_DIR", "reports"))
+        textfile = Path(os.environ.get("TIMINGS_TEXTFILE") or out_dir / f"{report}.prom")
+        # A node-exporter textfile directory gets one file per report
+        if textfile.is_dir():
+            textfile = textfile / f"report_{report}.prom"
+        return cls(report, json_file=out_dir / f"{report}.timings.json", textfile=textfile)
+
+    @classmethod
+    def disabled(cls, report: str) -> "PhaseTimer":
+        return cls(report, enabled=False)
+
+    def fresh(self) -> "PhaseTimer":
+        """An empty timer with the same configuration (for worker processes)."""
+        return PhaseTimer(self.report, self.json_file, self.textfile, self.enabled)
+
+    def span(self, phase: str, city: Optional[str] = None):
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(phase, city)
+
+    @contextmanager
+    def _span(self, phase: str, city: Optional[str]) -> Iterator[None]:
+        outer = self.city
+        if city is not None:
+            self.city = city
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start, self.city)
+            self.city = outer
+
+    def add(self, phase: str, seconds: float, city: Optional[str] = None) -> None:
+        self.samples.setdefault(phase, []).append(seconds)
+        if city is not None:
+            per_city = self.cities.setdefault(city, {})
+            per_city[phase] = per_city.get(phase, 0.0) + seconds
+
+    def take(self) -> dict:
+        """Samples recorded so far, cleared (a worker sends them to the parent)."""
+        taken = {"samples": self.samples, "cities": self.cities}
+        self.samples, self.cities = {}, {}
+        return taken
+
+    def merge(self, taken: dict) -> None:
+        for phase, values in taken.get("samples", {}).items():
+            self.samples.setdefault(phase, []).extend(values)
+        for city, phases in taken.get("cities", {}).items():
+            for phase, seconds in phases.items():
+                per_city = self.cities.setdefault(city, {})
+                per_city[phase] = per_city.get(phase, 0.0) + seconds
+
+    def summary(self) -> dict:
+        phases = {
+            phase: {
+                "count": len(values),
+                "total": round(sum(values), 4),
+                "p50": round(_quantile(values, 0.5), 4),
+                "p95": round(_quantile(values, 0.95), 4),
+                "max": round(max(values), 4),
+            }
+            for phase, values in self.samples.items()
+            if values
+        }
+        cities = {
+            city: {
+                "total": round(phases_.get("city", 0.0), 4),
+                "phases": {p: round(s, 4) for p, s in phases_.items() if p != "city"},
+            }
+            for city, phases_ in self.cities.items()
+        }
+        return {
+            "report": self.report,
+            "started": dt.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "wall_seconds": round(time.time() - self.started, 3),
+            "phases": phases,
+            "cities": cities,
+        }
+
+    def textfile_metrics(self, summary: dict) -> str:
+        report = _label(self.report)
+        lines = [
+            "# HELP report_phase_seconds Time spent in a runner phase (phases nest).",
+            "# TYPE report_phase_seconds summary",
+        ]
+        for phase, st in summary["phases"].items():
+            labels = f'report="{report}",phase="{_label(phase)}"'
+            lines.append(f'report_phase_seconds{{{labels},quantile="0.5"}} {st["p50"]}')
+            lines.append(f'report_phase_seconds{{{labels},quantile="0.95"}} {st["p95"]}')
+            lines.append(f"report_phase_seconds_sum{{{labels}}} {st['total']}")
+            lines.append(f"report_phase_seconds_count{{{labels}}} {st['count']}")
+        lines += [
+            "# HELP report_phase_max_seconds Longest single span of a runner phase.",
+            "# TYPE report_phase_max_seconds gauge",
+        ]
+        for phase, st in summary["phases"].items():
+            lines.append(f'report_phase_max_seconds{{report="{report}",phase="{_label(phase)}"}} {st["max"]}')
+        lines += [
+            "# HELP report_city_seconds Wall time spent on one city.",
+            "# TYPE report_city_seconds gauge",
+        ]
+        for city, st in summary["cities"].items():
+            lines.append(f'report_city_seconds{{report="{report}",city="{_label(city)}"}} {st["total"]}')
+        lines += [
+            "# HELP report_run_seconds Wall time of the last run.",
+            "# TYPE report_run_seconds gauge",
+            f'report_run_seconds{{report="{report}"}} {summary["wall_seconds"]}',
+            "# HELP report_last_run_timestamp_seconds End of the last run (Unix time).",
+            "# TYPE report_last_run_timestamp_seconds gauge",
+            f'report_last_run_timestamp_seconds{{report="{report}"}} {time.time():.0f}',
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        """Write the JSON summary and the textfile; print the slowest phases."""
+        if not self.enabled:
+            return
+        summary = self.summary()
+        try:
+            if self.json_file is not None:
+                _write_atomic(self.json_file, json.dumps(summary, ensure_ascii=False, indent=1))
+            if self.textfile is not None:
+                _write_atomic(self.textfile, self.textfile_metrics(summary))
+        except OSError as e:
+            print(f"[TIME] Замеры не записаны: {e}")
+            return
+        slowest = sorted(summary["phases"].items(), key=lambda kv: kv[1]["total"], reverse=True)[:5]
+        print(
+            "[TIME] "
+            + "; ".join(f"{p}: {s['count']}× p50 {s['p50']:.2f} с, p95 {s['p95']:.2f} с, max {s['max']:.2f} с" for p, s in slowest)
+        )
+        print(f"[TIME] Замеры: {self.json_file}, {self.textfile}")
@@ -0,0 +1,1108 @@
+"""Generic city -> department -> date traversal driven by a ``ReportSpec``.
+
+``ReportEngine`` holds everything the officemanager reports have in common:
+role selection, the SelectDepartment city list, opening the report page,
+the department ``<select>``, the period fields, building the report and
+waiting for it (CDP capture / MutationObserver / generation token), value
+extraction and the output side (CSV sink, checkpoint, ledger, Parquet,
+JSON Lines). ``ProjectManagerRunner`` and ``OfficeMaterialConsumptionReporter``
+subclass it; any other report only needs a spec file (see ``run_report.py``).
+"""
+
+import csv
+import datetime as dt
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from cdp_capture import ReportResponseCapture
+from checkpoint import Checkpoint
+from jsonl_stream import JsonlStream
+from ledger import Ledger
+from navigation import Navigator
+from parquet_output import ParquetDataset
+from phase_timing import PhaseTimer, timed
+from report_html import parse_table_rows, parse_total
+from report_spec import ReportSpec
+from report_wait import arm_generation, await_generation, await_report_change, install_report_observer
+from resource_policy import ResourceStats, resource_stats
+from result_sink import CsvSink
+
+
+DISPATCH_CHANGE_JS = (
+    "try{s.dispatchEvent(new Event('change',{bubbles:true}));}"
+    "catch(e){var ev=document.createEvent('HTMLEvents');ev.initEvent('change',true,false);s.dispatchEvent(ev);}"
+)
+
+# Submit the SelectDepartment form for one city from the current page: the
+# form (with its anti-forgery token) is fetched and posted in the background,
+# so neither SelectRole nor SelectDepartment is rendered
+SWITCH_CITY_JS = """
+var url = arguments[0], uuid = arguments[1], done = arguments[arguments.length - 1];
+function bad(url) { return /\/(SelectRole|SelectDepartment|Login|Account)/i.test(url) || new URL(url).host !== location.host; }
+fetch(url, {credentials: 'same-origin'}).then(function (r) {
+  if (!r.ok || bad(r.url)) throw new Error('SelectDepartment: ' + r.status + ' ' + r.url);
+  return r.text().then(function (html) { return [r.url, html]; });
+}).then(function (page) {
+  var doc = new DOMParser().parseFromString(page[1], 'text/html');
+  var btn = Array.from(doc.querySelectorAll('[name="uuid"]')).find(function (b) { return b.getAttribute('value') === uuid; });
+  var form = btn && btn.closest('form');
+  if (!form) throw new Error('нет формы выбора города');
+  var body = new URLSearchParams();
+  Array.from(form.elements).forEach(function (el) {
+    if (el.name && el.name !== 'uuid' && el.type !== 'submit' && el.type !== 'button') body.append(el.name, el.value);
+  });
+  body.append('uuid', uuid);
+  var action = new URL(form.getAttribute('action') || page[0], page[0]).href;
+  return fetch(action, {method: 'POST', credentials: 'same-origin', body: body});
+}).then(function (r) {
+  done(r.ok && !bad(r.url) ? {ok: true, url: r.url} : {ok: false, error: r.status + ' ' + r.url});
+}).catch(function (e) { done({ok: false, error: String(e)}); });
+"""
+
+
+class ReportEngine:
+    def __init__(
+        self,
+        driver,
+        spec: ReportSpec,
+        csv_file: Optional[Path] = None,
+        wait_timeout: int = 25,
+        slow_delay: float = 0.0,
+        cdp_capture: bool = False,
+        observer_wait: bool = False,
+        report_timeout: float = 10.0,
+        highlight: bool = True,
+        bulk_read: bool = True,
+        ledger_path: Optional[Path] = None,
+        final_after_days: int = 2,
+        parquet_dir: Optional[Path] = None,
+        stream: Optional[JsonlStream] = None,
+        checkpoint: Optional[Checkpoint] = None,
+        resume: bool = False,
+        csv_flush_rows: int = 200,
+        csv_flush_interval: float = 1.0,
+        navigator: Optional[Navigator] = None,
+        fast_switch: bool = False,
+        timer: Optional[PhaseTimer] = None,
+    ) -> None:
+        self.spec = spec
+        # TIMINGS=1: per-phase spans; a disabled timer records nothing
+        self.timer = timer if timer is not None else PhaseTimer.disabled(spec.name)
+        self.role_id = spec.role_id
+        self.select_department_url = spec.select_department_url
+        self.back_to_select_role_url = spec.back_to_select_role_url
+        self.report_url = spec.report_url
+        self.csv_file = Path(csv_file) if csv_file else spec.csv_file
+        self.wait_timeout = wait_timeout
+        self.slow_delay = slow_delay
+        self.cdp_capture = cdp_capture
+        # OBSERVER_WAIT=1: wait for the report via MutationObserver
+        self.observer_wait = observer_wait
+        self.report_timeout = report_timeout
+        # Green highlight of read cells is a debugging aid; off in headless runs
+        self.highlight = highlight
+        self.bulk_read = bulk_read
+        # INCREMENTAL=1: reuse final days from the SQLite ledger instead of re-scraping
+        self.ledger_path = ledger_path
+        self.final_after_days = final_after_days
+        self.ledger = Ledger(ledger_path, final_after_days) if ledger_path else None
+        self.parquet_dir = parquet_dir
+        self.dataset: Optional[ParquetDataset] = None
+        if parquet_dir:
+            try:
+                self.dataset = ParquetDataset.for_spec(parquet_dir, spec)
+            except RuntimeError as e:
+                print(f"[WARN] {e}")
+        self.stream = stream
+        # Progress is committed after every written unit; resume continues from it
+        self.checkpoint = checkpoint
+        self.resume = resume
+        # When set, rows are collected here instead of being written to csv_file
+        self.row_buffer: Optional[List[List[str]]] = None
+        self.sink = CsvSink(
+            self.csv_file,
+            batch_rows=csv_flush_rows,
+            flush_interval=csv_flush_interval,
+            on_flush=checkpoint.commit_marked if checkpoint is not None else None,
+        )
+        self.driver = None
+        self.wait: Optional[WebDriverWait] = None
+        self.capture: Optional[ReportResponseCapture] = None
+        # Engines sharing one browser session share its navigator
+        self.nav: Optional[Navigator] = navigator
+        # FAST_SWITCH=1: change city by an in-page form post instead of BackToSelectRole
+        self.fast_switch = fast_switch
+        if driver is not None:
+            self.attach(driver)
+
+    def attach(self, driver) -> None:
+        """Start using ``driver`` (engines created before Chrome is up attach later)."""
+        self.driver = driver
+        self.wait = WebDriverWait(driver, self.wait_timeout)
+        # CDP_CAPTURE=1: read the report XHR body instead of polling the DOM
+        self.capture = ReportResponseCapture(driver) if self.cdp_capture else None
+        # RESOURCE_POLICY: blocked/loaded request counters of this browser
+        self.resources: Optional[ResourceStats] = resource_stats(driver)
+        if self.nav is None or self.nav.driver is not driver:
+            self.nav = Navigator(driver, urlsplit(self.select_department_url).netloc)
+
+    # ---------- Navigation / auth ----------
+    def ensure_role_selected(self, city_uuid: Optional[str] = None) -> None:
+        if "/SelectRole" not in self.driver.current_url:
+            return
+        with self.timer.span("role"):
+            self.pick_role(city_uuid)
+
+    def pick_role(self, city_uuid: Optional[str] = None) -> None:
+        # Log available roles to help choose role_id
+        try:
+            roles = self.driver.execute_script(
+                """
+                return Array.from(document.querySelectorAll('[name="roleId"]'))
+                  .map(el => ({
+                    tag: el.tagName,
+                    type: el.getAttribute('type') || '',
+                    value: el.getAttribute('value') || '',
+                    text: (el.textContent||el.value||'').trim()
+                  }));
+                """
+            ) or []
+            if roles:
+                print("[role] Доступные роли:")
+                for r in roles:
+                    print(f"[role] value={r.get('value')} text={r.get('text')}")
+        except Exception:
+            pass
+        try:
+            self.wait.until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, f'button[name="roleId"][value="{self.role_id}"]'))
+            ).click()
+        except Exception:
+            try:
+                self.wait.until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, f'[name="roleId"][value="{self.role_id}"]'))
+                ).click()
+            except Exception:
+                pass
+        try:
+            WebDriverWait(self.driver, 10).until(lambda d: "/SelectRole" not in d.current_url)
+        except Exception:
+            pass
+        self.nav.role_selected(self.role_id)
+        # A role picked from a report page lands on SelectDepartment: pick the city again
+        if city_uuid:
+            try:
+                self.click_city(city_uuid)
+            except Exception:
+                pass
+
+    def open_select_department(self) -> None:
+        self.nav.get(self.select_department_url)
+        self.ensure_role_selected()
+        if "/SelectDepartment" not in self.driver.current_url:
+            try:
+                self.nav.get(self.select_department_url)
+            except Exception:
+                pass
+
+    def back_to_select_role(self) -> None:
+        try:
+            self.nav.get(self.back_to_select_role_url, force=True)
+        except Exception:
+            pass
+        try:
+            WebDriverWait(self.driver, 10).until(EC.url_contains("/SelectRole"))
+        except Exception:
+            pass
+        self.ensure_role_selected()
+        self.open_select_department()
+
+    # ---------- Cities ----------
+    @timed("cities")
+    def get_cities(self) -> List[Tuple[str, str]]:
+        self.open_select_department()
+        print(f"[nav] Текущий URL: {self.driver.current_url}")
+        try:
+            self.wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, '*[name="uuid"]')))
+        except Exception:
+            # Extra hint if stuck on role selection
+            if "/SelectRole" in self.driver.current_url:
+                print(f"[hint] Похоже, вы на странице выбора роли. Проверьте роль {self.role_id}.")
+            raise
+        try:
+            items = self.driver.execute_script(
+                """
+                return Array.from(document.querySelectorAll('*[name="uuid"]'))
+                  .map(b => ({
+                    name: (b.textContent || '').trim(),
+                    uuid: b.getAttribute('value') || b.getAttribute('data-value') || b.getAttribute('data-uuid') ||
+                          b.getAttribute('uuid') || b.getAttribute('data-id') || '',
+                  }))
+                  .filter(x => x.name && x.uuid);
+                """
+            ) or []
+        except Exception:
+            items = []
+        cities: List[Tuple[str, str]] = []
+        seen = set()
+        for it in items:
+            uuid = it.get("uuid")
+            name = it.get("name")
+            if uuid and name and uuid not in seen:
+                seen.add(uuid)
+                cities.append((name, uuid))
+        cities.sort(key=lambda x: x[0].lower())
+        if not cities:
+            raise RuntimeError("Не удалось получить список городов на SelectDepartment")
+        return cities
+
+    def click_city(self, city_uuid: str) -> None:
+        try:
+            self.wait.until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, f'button[name="uuid"][value="{city_uuid}"]'))
+            ).click()
+        except Exception:
+            self.wait.until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, f'a[name="uuid"][value="{city_uuid}"]'))
+            ).click()
+        self.nav.city_selected(city_uuid)
+
+    def switch_city_direct(self, city_uuid: str) -> bool:
+        """Pick the city by posting the SelectDepartment form from the current page."""
+        if self.nav.role not in (None, self.role_id) or not self.nav.here().startswith("http"):
+            return False
+        try:
+            self.driver.set_script_timeout(max(self.wait_timeout, 5))
+            result = self.driver.execute_async_script(SWITCH_CITY_JS, self.select_department_url, city_uuid)
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        if not isinstance(result, dict) or not result.get("ok"):
+            print(f"[NAV] Прямая смена города не удалась ({(result or {}).get('error')}); обычный путь")
+            return False
+        self.nav.switched(city_uuid)
+        return True
+
+    @timed("city_switch")
+    def select_city(self, city_uuid: str) -> None:
+        if self.nav.has_city(self.role_id, city_uuid):
+            # Another report of the same role already picked this city
+            self.nav.skip()
+            return
+        if self.fast_switch and self.nav.city is not None:
+            if self.switch_city_direct(city_uuid):
+                return
+            self.back_to_select_role()
+        self.open_select_department()
+        self.ensure_role_selected()
+        self.click_city(city_uuid)
+        time.sleep(0.2)
+
+    def print_summary(self) -> None:
+        print(self.nav.summary())
+        if self.resources is not None:
+            print(self.resources.summary())
+
+    @timed("leave_city")
+    def leave_city(self) -> None:
+        # With FAST_SWITCH the next select_city posts the new city from the current page
+        if self.fast_switch:
+            return
+        # Return to SelectRole between cities
+        try:
+            self.back_to_select_role()
+        except Exception as e:
+            print(f"[WARN] Не удалось вернуться на SelectRole: {e}")
+
+    @timed("open_report")
+    def open_report(self, city_uuid: Optional[str] = None, force: bool = False) -> None:
+        """Open the report page; ``force`` reloads it even if it is already shown."""
+        if not self.nav.get(self.report_url, force=force):
+            return
+        self.ensure_role_selected(city_uuid)
+        # Some pages require a short delay for scripts to wire up
+        time.sleep(0.2)
+
+    # ---------- Filters ----------
+    @timed("filters")
+    def apply_filters(self) -> None:
+        for select_id in self.spec.select_all:
+            try:
+                self.driver.execute_script(
+                    "var s=document.getElementById(arguments[0]); if(!s) return;"
+                    "Array.from(s.options).forEach(o=>o.selected=true);" + DISPATCH_CHANGE_JS,
+                    select_id,
+                )
+            except Exception:
+                pass
+        for field_id, value in self.spec.filter_values.items():
+            try:
+                self.driver.execute_script(
+                    "var s=document.getElementById(arguments[0]); if(!s) return; s.value=arguments[1];"
+                    + DISPATCH_CHANGE_JS,
+                    field_id,
+                    value,
+                )
+            except Exception:
+                pass
+        for field_id in self.spec.wait_for:
+            try:
+                self.wait.until(EC.presence_of_element_located((By.ID, field_id)))
+            except Exception:
+                pass
+
+    def select_all_departments(self) -> None:
+        try:
+            self.driver.execute_script(
+                "var s=document.getElementById(arguments[0]); if(!s) return;"
+                "Array.from(s.options).forEach(o=>o.selected=true);" + DISPATCH_CHANGE_JS,
+                self.spec.department_select,
+            )
+        except Exception:
+            pass
+
+    # ---------- Departments ----------
+    @timed("departments")
+    def get_departments(self, limit: Optional[int] = None) -> List[str]:
+        select_id = self.spec.department_select
+        exclude = self.spec.department_exclude
+        names: List[str] = []
+        for _ in range(100):
+            try:
+                names = self.driver.execute_script(
+                    "return Array.from(document.querySelectorAll('#' + arguments[0] + ' option'))"
+                    "  .map(o => (o.text||'').trim()).filter(Boolean);",
+                    select_id,
+                ) or []
+            except Exception:
+                names = []
+            names = [n for n in names if n.lower() not in exclude]
+            if names:
+                break
+            time.sleep(0.1)
+        if not names and self.spec.department_widget == "sumo":
+            # Fallback: attempt to open the dropdown and read items
+            try:
+                opened = self.driver.execute_script(
+                    "var s=document.getElementById(arguments[0]); if(!s) return false;\n"
+                    "var box=s.closest('.select-report'); if(!box) return false;\n"
+                    "var cap=box.querySelector('.CaptionCont'); if(!cap) return false; cap.click(); return true;",
+                    select_id,
+                )
+                if opened:
+                    time.sleep(0.3)
+                names = self.driver.execute_script(
+                    "return Array.from(document.querySelectorAll('.open li'))\n"
+                    "  .map(li => (li.textContent||'').trim()).filter(Boolean);"
+                ) or []
+                names = [n for n in names if n.lower() not in exclude]
+            except Exception:
+                names = []
+        if not names and self.spec.departments_required:
+            raise RuntimeError(f"Список отделов пуст ({select_id})")
+        if limit is not None:
+            names = names[: max(0, int(limit))]
+        return names
+
+    def force_select_only_one_by_text(self, dept_name: str) -> List[str]:
+        try:
+            selected = self.driver.execute_script(
+                """
+                var s=document.getElementById(arguments[0]);
+                if(!s) return [];
+                var name=arguments[1];
+                var changed=false;
+                Array.from(s.options).forEach(o => {
+                  var sel=((o.text||'').trim()===name);
+                  if(o.selected!==sel){ o.selected=sel; changed=true; }
+                });
+                if(changed){
+                  var e; try{e=new Event('change',{bubbles:true});}catch(err){e=document.createEvent('HTMLEvents'); e.initEvent('change',true,false);} s.dispatchEvent(e);
+                }
+                return Array.from(s.selectedOptions).map(o=>(o.text||'').trim());
+                """,
+                self.spec.department_select,
+                dept_name,
+            )
+            if isinstance(selected, list):
+                return [str(x) for x in selected]
+            return []
+        except Exception:
+            return []
+
+    @timed("choose_department")
+    def choose_department(self, dept_name: str) -> None:
+        # Try up to 3 times to enforce a single selection
+        for _ in range(3):
+            chosen = self.force_select_only_one_by_text(dept_name)
+            if len(chosen) == 1 and chosen[0] == dept_name:
+                break
+            time.sleep(0.1)
+        # Align the UI wrapper with the <select> (best-effort)
+        try:
+            if self.spec.department_widget == "selectpicker":
+                self.driver.execute_script(
+                    "var s=document.getElementById(arguments[0]);"
+                    "if(s && window.$ && window.$(s).selectpicker){ try{ window.$(s).selectpicker('render'); }catch(e){} }",
+                    self.spec.department_select,
+                )
+            else:
+                self.driver.execute_script(
+                    """
+                    var s=document.getElementById(arguments[0]); if(!s) return;
+                    var name=arguments[1];
+                    var box=s.closest('.select-report'); if(!box) return;
+                    box.querySelectorAll('li').forEach(li=>{
+                      var t=(li.textContent||'').trim();
+                      var sel=li.classList.contains('selected');
+                      if(t===name && !sel){ li.click(); }
+                      if(t!==name && sel){ li.click(); }
+                    });
+                    """,
+                    self.spec.department_select,
+                    dept_name,
+                )
+        except Exception:
+            pass
+        if self.slow_delay:
+            time.sleep(self.slow_delay)
+
+    # ---------- Period / build ----------
+    def compute_dates(self) -> List[dt.date]:
+        today = dt.date.today()
+        start = today.replace(day=1)
+        yesterday = today - dt.timedelta(days=1)
+        if yesterday < start:
+            return []
+        days = (yesterday - start).days + 1
+        return [start + dt.timedelta(days=i) for i in range(days)]
+
+    def set_period_dates(self, d: dt.date, end: Optional[dt.date] = None) -> None:
+        # Set start/end fields directly and dispatch input/change events
+        start_s = d.strftime(self.spec.date_format)
+        end_s = (end or d).strftime(self.spec.date_format)
+        js = """
+        function setVal(id, val){
+          var el=document.getElementById(id); if(!el) return false;
+          el.value=val;
+          try{ el.dispatchEvent(new Event('input',{bubbles:true})); }catch(e){ var ev=document.createEvent('HTMLEvents'); ev.initEvent('input',true,false); el.dispatchEvent(ev); }
+          try{ el.dispatchEvent(new Event('change',{bubbles:true})); }catch(e){ var ev2=document.createEvent('HTMLEvents'); ev2.initEvent('change',true,false); el.dispatchEvent(ev2); }
+          return true;
+        }
+        return [setVal(arguments[0], arguments[2]), setVal(arguments[1], arguments[3])];
+        """
+        try:
+            self.driver.execute_script(js, self.spec.period_start, self.spec.period_end, start_s, end_s)
+        except Exception:
+            pass
+
+    def _click(self, locator: str) -> None:
+        by, sel = (By.XPATH, locator[6:]) if locator.startswith("xpath:") else (By.CSS_SELECTOR, locator)
+        btn = self.wait.until(EC.element_to_be_clickable((by, sel)))
+        try:
+            self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", btn)
+        except Exception:
+            pass
+        btn.click()
+
+    def click_build_report(self) -> None:
+        buttons = self.spec.build_buttons
+        try:
+            self._click(buttons[0])
+            return
+        except Exception:
+            pass
+        # Fallback: the page's JS entry point, then the remaining locators
+        try:
+            if self.driver.execute_script(
+                "var f=window[arguments[0]]; if(typeof f==='function'){ f(); return true; } return false;",
+                self.spec.build_js,
+            ):
+                return
+        except Exception:
+            pass
+        for locator in buttons[1:]:
+            try:
+                self._click(locator)
+                return
+            except Exception:
+                continue
+
+    def parse_html(self, html: str) -> Any:
+        if self.spec.kind == "table":
+            return parse_table_rows(html, self.spec.table_rows, self.spec.value_columns)
+        return parse_total(html, self.spec.total_selectors)
+
+    @timed("build")
+    def build(self, d: dt.date) -> Any:
+        """Build the report for one day and return its value.
+
+        Total reports return a normalized string, table reports a list of
+        (category, values). With CDP capture or the observer the value is
+        parsed from the captured markup; otherwise it is read from the DOM
+        once the request generation armed before the click has completed.
+        """
+        if self.spec.filters_per_build:
+            self.apply_filters()
+        self.set_period_dates(d)
+        if self.capture is not None and self.capture.enabled:
+            armed, watching = self.arm_build()
+            # Only the request to the report form's action is the build response
+            self.capture.arm(armed.get("match") if armed else None)
+            self.click_build_report()
+            body = self.capture.wait_body(self.report_timeout)
+            value = self.parse_html(body) if body else None
+            if value:
+                return value
+            # Missed, empty or unrecognised response: wait for the build itself, then read the DOM
+            return self.await_build(d, armed, watching)
+        if self.observer_wait and self.watch_report():
+            self.click_build_report()
+            return self.await_build(d, None, True)
+        # Track the build request itself, so an unchanged result does not look stale
+        armed, watching = self.arm_build()
+        self.click_build_report()
+        return self.await_build(d, armed, watching)
+
+    def watch_report(self) -> bool:
+        return install_report_observer(
+            self.driver, self.spec.observe, self.spec.observe_parent, self.value_selector()
+        )
+
+    def arm_build(self) -> Tuple[Optional[dict], bool]:
+        """Instrument the page before a build click: the generation token, else
+        (the page could not be instrumented) an observer of the report content."""
+        armed = arm_generation(self.driver, self.spec.container, self.spec.period_start)
+        if armed is not None:
+            return armed, False
+        return None, self.watch_report()
+
+    def await_build(self, d: dt.date, armed: Optional[dict], watching: bool) -> Any:
+        """Value of the build just clicked, read only once the build has completed."""
+        if armed is not None:
+            if not await_generation(self.driver, armed, self.report_timeout):
+                return self.build_timed_out(d)
+            return self.read_value()
+        if not watching:
+            return self.build_untracked(d)
+        html = await_report_change(self.driver, self.report_timeout)
+        if html is None:
+            return self.build_timed_out(d)
+        # The value is in the DOM now; read it there if the markup did not parse
+        return self.parse_html(html) or self.read_value()
+
+    def empty_value(self) -> Any:
+        return [] if self.spec.kind == "table" else ""
+
+    def build_timed_out(self, d: dt.date) -> Any:
+        # The DOM still shows the previous build: an empty value is not stored in
+        # the ledger, so the day is collected again on the next run
+        print(f"[WARN] {d:%d.%m.%Y}: отчёт не построился за {self.report_timeout:.0f} с — значение пропущено")
+        return self.empty_value()
+
+    def build_untracked(self, d: dt.date) -> Any:
+        # Neither the token nor the observer could be set up: the DOM cannot be trusted
+        print(f"[WARN] {d:%d.%m.%Y}: завершение построения не отследить ({self.spec.observe} не найден) — значение пропущено")
+        return self.empty_value()
+
+    # ---------- Extraction ----------
+    def value_selector(self) -> str:
+        """CSS selector of the elements that carry the report value."""
+        if self.spec.kind == "table":
+            return self.spec.table_rows
+        return ", ".join(self.spec.total_selectors)
+
+    def read_value(self) -> Any:
+        if self.spec.kind == "table":
+            return self.read_table_rows()
+        return self.read_total_value()
+
+    @timed("read")
+    def read_total_value(self) -> str:
+        # Prefer explicit total cells, then fallback to last numeric cell
+        for sel in self.spec.total_selectors:
+            try:
+                elems = self.driver.find_elements(By.CSS_SELECTOR, sel)
+            except Exception:
+                elems = []
+            if not elems:
+                continue
+            candidates = [e for e in elems if (e.text or "").strip() and any(c.isdigit() for c in e.text)]
+            if not candidates:
+                continue
+            target = candidates[-1]
+            if self.highlight:
+                try:
+                    self.driver.execute_script(
+                        "arguments[0].style.backgroundColor='#00ff00';arguments[0].style.color='#000';",
+                        target,
+                    )
+                except Exception:
+                    pass
+            txt = (target.text or "").replace("\xa0", " ").strip()
+            # Normalize Russian currency formatting (spaces as thousands, comma or dot as decimal)
+            txt = txt.replace("₽", "").replace(" ", "")
+            return txt
+        return ""
+
+    @timed("read")
+    def read_table_rows(self) -> List[Tuple[str, List[str]]]:
+        self.wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, self.spec.table_rows)))
+        if self.bulk_read:
+            return self.read_table_rows_bulk()
+        n = self.spec.value_columns
+        result: List[Tuple[str, List[str]]] = []
+        for tr in self.driver.find_elements(By.CSS_SELECTOR, self.spec.table_rows):
+            tds = tr.find_elements(By.TAG_NAME, "td")
+            if not tds:
+                continue
+            name = (tds[0].text or "").strip()
+            values: List[str] = []
+            for td in tds[1 : n + 1]:
+                if self.highlight:
+                    try:
+                        self.driver.execute_script(
+                            "arguments[0].style.backgroundColor='#00ff00';arguments[0].style.color='#000';", td
+                        )
+                    except Exception:
+                        pass
+                values.append((td.text or "").replace("\xa0", "").replace(" ", ""))
+            result.append((name, values))
+        return result
+
+    def read_table_rows_bulk(self) -> List[Tuple[str, List[str]]]:
+        """The whole table in one execute_script: a 2-D array instead of a request per cell."""
+        n = self.spec.value_columns
+        try:
+            table = self.driver.execute_script(
+                """
+                var hl = arguments[1], n = arguments[2];
+                return Array.from(document.querySelectorAll(arguments[0])).map(function (tr) {
+                  var cells = Array.from(tr.cells);
+                  if (hl) cells.slice(1, n + 1).forEach(function (td) { td.style.backgroundColor='#00ff00'; td.style.color='#000'; });
+                  return cells.map(function (td) { return (td.innerText || '').trim(); });
+                });
+                """,
+                self.spec.table_rows,
+                self.highlight,
+                n,
+            ) or []
+        except Exception:
+            table = []
+        result: List[Tuple[str, List[str]]] = []
+        for cells in table:
+            if not cells:
+                continue
+            values = [str(txt).replace("\xa0", "").replace(" ", "") for txt in cells[1 : n + 1]]
+            result.append((str(cells[0]), values))
+        return result
+
+    # ---------- Output ----------
+    def reset_csv(self) -> None:
+        if self.spec.header:
+            self.sink.reset(self.spec.header)
+            return
+        self.sink.close()
+        self.csv_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.csv_file, "w", encoding="utf-8-sig", newline="") as f:
+            f.write("\ufeff")
+        self.sink.open()
+
+    def append_csv_row(self, row: List[str]) -> None:
+        self.append_csv_rows([row])
+
+    def append_csv_rows(self, rows: List[List[str]]) -> None:
+        if self.row_buffer is not None:
+            self.row_buffer.extend(list(r) for r in rows)
+            return
+        self.sink.write_many(rows)
+
+    def write_city_header(self, city_name: str) -> None:
+        if self.spec.layout != "sections":
+            return
+        if not self.unit_done(city_name, "city"):
+            self.append_csv_row([f"ГОРОД: {city_name}", ""])  # header
+            self.commit_unit(city_name, "city")
+
+    def write_department_header(self, city_name: str, dept: str) -> None:
+        if self.spec.layout != "sections":
+            return
+        key = f"dept:{dept}"
+        if not self.unit_done(city_name, key):
+            self.append_csv_row([f"ОТДЕЛ: {dept}", ""])  # section
+            self.commit_unit(city_name, key)
+
+    def write_city_error(self, city_name: str, error: Exception) -> None:
+        if self.spec.layout == "sections":
+            self.append_csv_row([f"ГОРОД: {city_name}", f"ОШИБКА: {error}"])
+            self.append_csv_row(["", ""])  # separator
+
+    def output_rows(self, city_name: str, dept: str, d: dt.date, value: Any) -> List[List[str]]:
+        day = d.strftime("%d.%m.%Y")
+        if self.spec.kind == "table":
+            if self.spec.layout == "flat":
+                return [[city_name, dept, day, cat, *vals] for cat, vals in value]
+            return [[day, cat, *vals] for cat, vals in value]
+        if self.spec.layout == "flat":
+            return [[city_name, dept, day, value]]
+        return [[day, value]]
+
+    @timed("write")
+    def write_value(self, city_name: str, dept: str, d: dt.date, value: Any) -> None:
+        self.append_csv_rows(self.output_rows(city_name, dept, d, value))
+        self.commit_unit(city_name, f"val:{dept}:{d}")
+        self.add_to_dataset(city_name, dept, d, value)
+        if self.stream is not None:
+            if self.spec.kind == "table":
+                self.stream.emit_table_rows(
+                    self.spec.name, city_name, dept, d, value, self.spec.columns, self.spec.scale
+                )
+            else:
+                self.stream.emit_total(self.spec.name, city_name, dept, d, value, self.spec.scale)
+
+    def add_to_dataset(self, city_name: str, dept: str, d: dt.date, value: Any) -> None:
+        if self.dataset is None:
+            return
+        if self.spec.kind == "table":
+            self.dataset.add_table_rows(city_name, dept, d, value)
+        else:
+            self.dataset.add_total(city_name, dept, d, value)
+
+    def csv_values(self, city_name: str) -> Dict[Tuple[str, dt.date], Any]:
+        """Values of ``city_name`` already in the CSV (the inverse of output_rows)."""
+        values: Dict[Tuple[str, dt.date], Any] = {}
+        city: Optional[str] = None
+        dept: Optional[str] = None
+        with open(self.csv_file, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.reader(f, delimiter=self.sink.delimiter):
+                if not row:
+                    continue
+                # reset_csv() writes a BOM of its own after the encoding's one
+                row[0] = row[0].lstrip("\ufeff")
+                if self.spec.layout == "flat":
+                    if len(row) < 4 or row[0] != city_name:
+                        continue
+                    dept, cells = row[1], row[2:]
+                elif row[0].startswith("ГОРОД: "):
+                    city, dept = row[0][len("ГОРОД: ") :], None
+                    continue
+                elif row[0].startswith("ОТДЕЛ: "):
+                    dept = row[0][len("ОТДЕЛ: ") :]
+                    continue
+                elif city != city_name or dept is None:
+                    continue
+                else:
+                    cells = row
+                try:
+                    d = dt.datetime.strptime(cells[0], "%d.%m.%Y").date()
+                except (ValueError, IndexError):
+                    continue
+                if self.spec.kind == "table":
+                    values.setdefault((dept, d), []).append((cells[1], cells[2:]))
+                else:
+                    values[(dept, d)] = cells[1] if len(cells) > 1 else ""
+        return values
+
+    def restore_dataset(self, city_name: str) -> None:
+        # A partition is written when its city is finished: on resume, the days
+        # committed before the interruption are skipped, so take them from the CSV
+        if self.dataset is None or self.checkpoint is None or not self.checkpoint.city_started(city_name):
+            return
+        try:
+            restored = self.csv_values(city_name)
+        except OSError as e:
+            print(f"[WARN] Parquet: строки {city_name} из {self.csv_file} не прочитаны: {e}")
+            return
+        for (dept, d), value in restored.items():
+            self.add_to_dataset(city_name, dept, d, value)
+        print(f"[RESUME] Parquet: {len(restored)} значений {city_name} взято из CSV")
+
+    def flush_dataset(self, city_name: str) -> None:
+        # Each city owns its partitions, so workers write them without coordination
+        if self.dataset is None:
+            return
+        try:
+            self.dataset.flush_city(city_name)
+        except Exception as e:
+            print(f"[WARN] Parquet для {city_name} не записан: {e}")
+
+    # ---------- Ledger ----------
+    def ledger_values(self, city_name: str) -> Dict[Tuple[str, dt.date], Any]:
+        if self.ledger is None:
+            return {}
+        cached = self.ledger.final_values(self.spec.name, city_name)
+        if self.spec.kind == "table":
+            # Table rows are stored as [category, *values]
+            return {key: [(row[0], row[1:]) for row in payload] for key, payload in cached.items()}
+        return cached
+
+    def record(self, city_name: str, results: Dict[str, List[Tuple[dt.date, Any]]]) -> None:
+        # Empty reads are not remembered, so they are retried on the next run
+        if self.ledger is None:
+            return
+        items = []
+        for dept, rows in results.items():
+            for d, value in rows:
+                if not value:
+                    continue
+                if self.spec.kind == "table":
+                    value = [[cat, *vals] for cat, vals in value]
+                items.append((dept, d, value))
+        if items:
+            self.ledger.put_many(self.spec.name, city_name, items)
+
+    # ---------- Checkpoint ----------
+    def unit_done(self, city_name: str, key: str) -> bool:
+        return self.checkpoint is not None and self.checkpoint.unit_done(city_name, key)
+
+    def commit_unit(self, city_name: str, key: str) -> None:
+        # Marked by the sink's writer thread once the unit's rows are fsynced
+        checkpoint = self.checkpoint
+        if checkpoint is not None and self.row_buffer is None:
+            self.sink.after_flush(lambda offset: checkpoint.mark(city_name, key, offset))
+
+    def finish_city(self, city_name: str) -> None:
+        if self.resources is not None:
+            # Drain the network log once per city so it does not pile up in chromedriver
+            self.resources.poll()
+        checkpoint = self.checkpoint
+        if checkpoint is not None:
+            self.sink.after_flush(lambda offset: checkpoint.finish_city(city_name, offset))
+
+    def city_done(self, city_name: str) -> bool:
+        return self.checkpoint is not None and self.checkpoint.city_done(city_name)
+
+    def start_output(self, dates: List[dt.date]) -> List[dt.date]:
+        # Fresh run: truncate the CSV. Resume: keep it and continue the checkpointed range.
+        if self.checkpoint is not None:
+            resumed = self.checkpoint.start(dates, self.resume)
+            if resumed is not None:
+                self.sink.open()
+                return resumed
+        self.reset_csv()
+        if self.checkpoint is not None:
+            self.checkpoint.commit()
+        return dates
+
+    def finish_output(self) -> None:
+        with self.timer.span("csv_close"):
+            self.sink.close()
+        if self.checkpoint is not None:
+            self.checkpoint.finish()
+        self.timer.write()
+
+    def close_output(self) -> None:
+        # Rows still queued are written out; the checkpoint only covers fsynced ones
+        try:
+            self.sink.close()
+        except Exception:
+            pass
+        if self.ledger is not None:
+            self.ledger.close()
+
+    # ---------- Main flow ----------
+    @timed("prepare")
+    def prepare(self) -> Tuple[List[Tuple[str, str]], List[dt.date]]:
+        self.open_select_department()
+        cities = self.get_cities()
+        print(f"[CITIES] Найдено: {len(cities)} — {', '.join([c[0] for c in cities])}")
+
+        dates = self.compute_dates()
+        print(
+            f"[DATES] Диапазон: {dates[0]:%d.%m.%Y} — {dates[-1]:%d.%m.%Y} (всего {len(dates)})"
+            if dates
+            else "[DATES] Сегодня 1-е — диапазон пуст"
+        )
+        return cities, dates
+
+    def open_city_report(self, city_name: str, city_uuid: str) -> List[str]:
+        """Select the city, open the report page and return its departments."""
+        self.select_city(city_uuid)
+        self.open_report(city_uuid)
+        if not self.spec.filters_per_build:
+            self.apply_filters()
+        departments = self.get_departments()
+        print(f"[DEPTS] {departments}")
+        if self.ledger is not None:
+            self.ledger.set_departments(self.spec.name, city_name, departments)
+        return departments
+
+    def cached_city(self, city_name: str, dates: List[dt.date]) -> Optional[Tuple[List[str], Dict]]:
+        """Departments and values of a city whose days are all final in the ledger."""
+        if self.ledger is None:
+            return None
+        cached = self.ledger_values(city_name)
+        known = self.ledger.departments(self.spec.name, city_name)
+        if known and all((dept, d) in cached for dept in known for d in dates):
+            return known, cached
+        return None
+
+    def write_departments(
+        self,
+        city_name: str,
+        departments: List[str],
+        dates: List[dt.date],
+        results: Dict[str, List[Tuple[dt.date, Any]]],
+        cached: Dict[Tuple[str, dt.date], Any],
+    ) -> None:
+        empty: Any = [] if self.spec.kind == "table" else ""
+        for dept in departments:
+            self.write_department_header(city_name, dept)
+            fetched = dict(results.get(dept, []))
+            for d in dates:
+                if self.unit_done(city_name, f"val:{dept}:{d}"):
+                    continue
+                value = fetched[d] if d in fetched else cached.get((dept, d), empty)
+                self.write_value(city_name, dept, d, value)
+
+    def process_city(self, city_name: str, city_uuid: str, dates: List[dt.date]) -> bool:
+        """Collect one city; returns False if it was served from the ledger without navigation."""
+        with self.timer.span("city", city=city_name):
+            return self.collect_city_output(city_name, city_uuid, dates)
+
+    def collect_city_output(self, city_name: str, city_uuid: str, dates: List[dt.date]) -> bool:
+        self.restore_dataset(city_name)
+        hit = self.cached_city(city_name, dates)
+        if hit is not None:
+            print(f"[LEDGER] {city_name}: все дни уже собраны, город пропущен")
+            known, cached = hit
+            self.write_city_header(city_name)
+            self.write_departments(city_name, known, dates, {}, cached)
+            return False
+        cached = self.ledger_values(city_name)
+        try:
+            departments = self.open_city_report(city_name, city_uuid)
+            self.write_city_header(city_name)
+            with self.timer.span("collect"):
+                results = self.collect_city(city_name, departments, dates, cached)
+            if results is not None:
+                self.record(city_name, results)
+                self.write_departments(city_name, departments, dates, results, cached)
+                return True
+            for didx, dept in enumerate(departments, start=1):
+                print("\n" + "=" * 80)
+                print(f"[DEPT] ({didx}/{len(departments)}) {dept}")
+                self.write_department_header(city_name, dept)
+                self.collect_department(city_name, dept, dates, cached)
+        except Exception as e:
+            print(f"[WARN] Ошибка при обработке города {city_name}: {e}")
+            self.write_city_error(city_name, e)
+        return True
+
+    def collect_city(
+        self,
+        city_name: str,
+        departments: List[str],
+        dates: List[dt.date],
+        cached: Dict[Tuple[str, dt.date], Any],
+    ) -> Optional[Dict[str, List[Tuple[dt.date, Any]]]]:
+        """Bulk collection hook: all values of the city at once, or None for the
+        sequential per-department loop. Subclasses plug faster engines in here."""
+        return None
+
+    def collect_department(
+        self, city_name: str, dept: str, dates: List[dt.date], cached: Dict[Tuple[str, dt.date], Any]
+    ) -> None:
+        chosen = False
+        for d in dates:
+            if self.unit_done(city_name, f"val:{dept}:{d}"):
+                continue
+            if (dept, d) in cached:
+                value = cached[(dept, d)]
+            else:
+                if not chosen:
+                    self.choose_department(dept)
+                    chosen = True
+                value = self.build(d)
+                self.record(city_name, {dept: [(d, value)]})
+            self.write_value(city_name, dept, d, value)
+            if self.spec.kind == "table":
+                print(f"[CSV] {dept} — {d:%d.%m.%Y}: {len(value)} строк")
+            else:
+                print(f"[CSV] {d:%d.%m.%Y}: {value}")
+
+    def run(self) -> int:
+        cities, dates = self.prepare()
+
+        dates = self.start_output(dates)
+
+        for cidx, (city_name, city_uuid) in enumerate(cities, start=1):
+            if self.city_done(city_name):
+                print(f"[RESUME] ({cidx}/{len(cities)}) {city_name}: уже собран")
+                continue
+            print("\n" + "#" * 80)
+            print(f"[CITY] ({cidx}/{len(cities)}) {city_name}")
+            visited = self.process_city(city_name, city_uuid, dates)
+            self.flush_dataset(city_name)
+            self.finish_city(city_name)
+            if visited:
+                self.leave_city()
+
+        self.finish_output()
+        print(f"[DONE] Готово! Файл {self.csv_file} сохранён.")
+        self.print_summary()
+        return 0
+
+
+def run_together(engines: List[ReportEngine]) -> int:
+    """Collect several reports in one pass over the cities, in one browser session.
+
+    Every city is visited once and all reports are collected before moving on.
+    The report order alternates per city (A, B | B, A | A, B …), so the role
+    left active by the last report of a city is reused for the first report
+    of the next one: one role switch per city instead of a full
+    SelectRole -> SelectDepartment round trip per report and city.
+    """
+    role: Optional[str] = None
+    switches = 0
+    # One session: the reports see (and skip) each other's navigation
+    for engine in engines[1:]:
+        engine.nav = engines[0].nav
+
+    def use_role(engine: ReportEngine) -> None:
+        nonlocal role, switches
+        if engine.role_id != role:
+            engine.back_to_select_role()
+            role = engine.role_id
+            switches += 1
+
+    plans: List[Tuple[ReportEngine, Dict[str, str], List[dt.date]]] = []
+    for engine in engines:
+        use_role(engine)
+        cities, dates = engine.prepare()
+        plans.append((engine, dict(cities), engine.start_output(dates)))
+
+    # Cities of all reports, in the order of the first report's list
+    order: List[str] = []
+    for _engine, cities, _dates in plans:
+        order.extend(name for name in cities if name not in order)
+
+    visits = 0
+    for cidx, city_name in enumerate(order, start=1):
+        print("\n" + "#" * 80)
+        print(f"[CITY] ({cidx}/{len(order)}) {city_name}")
+        for engine, cities, dates in plans if cidx % 2 else plans[::-1]:
+            if city_name not in cities:
+                continue
+            if engine.city_done(city_name):
+                print(f"[RESUME] {engine.spec.name}: {city_name} уже собран")
+                continue
+            print(f"[REPORT] {engine.spec.title}")
+            if engine.cached_city(city_name, dates) is None:
+                use_role(engine)
+                visits += 1
+            engine.process_city(city_name, cities[city_name], dates)
+            engine.flush_dataset(city_name)
+            engine.finish_city(city_name)
+
+    for engine, _cities, _dates in plans:
+        engine.finish_output()
+        print(f"[DONE] Готово! Файл {engine.csv_file} сохранён.")
+    print(f"[COMBINED] Отчётов: {len(plans)}; открытий отчёта: {visits}; смен роли: {switches}")
+    engines[0].print_summary()
+    return 0
@@ -0,0 +1,171 @@
+"""Parsing of report HTML fragments outside the browser.
+
+Used when the report markup is obtained without reading the DOM through
+WebDriver (direct HTTP requests, CDP response capture). Values are located
+with the spec's own selectors (``extract.selectors`` / ``extract.rows``), the
+same ones ``ReportEngine.read_total_value()`` and ``read_table_rows()`` use
+in the browser, so a new spec parses the same way in both places.
+
+Selectors are matched by a small CSS subset: tag, ``#id``, ``.class``,
+``[attr]``/``[attr=value]``, ``:first-child``/``:last-child``, the
+descendant and ``>`` combinators and ``,`` lists. Anything else raises
+``ValueError``.
+"""
+
+import re
+from html.parser import HTMLParser
+from typing import List, Optional, Sequence, Tuple
+
+
+def normalize_total(text: str) -> str:
+    # Same normalization as read_total_value(): drop currency and thousand separators
+    return (text or "").replace("\xa0", " ").strip().replace("₽", "").replace(" ", "")
+
+
+class _Element:
+    def __init__(self, tag: str, attrs: dict, parent: Optional["_Element"]) -> None:
+        self.tag = tag
+        self.attrs = attrs
+        self.classes = (attrs.get("class") or "").split()
+        self.parent = parent
+        self.children: List["_Element"] = []
+        self.parts: List[str] = []
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+# Elements without a closing tag, and those closed implicitly by a sibling
+_VOID = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+_IMPLIED_END = {"td": {"td", "th", "tr"}, "th": {"td", "th", "tr"}, "tr": {"tr"}, "li": {"li"}, "option": {"option"}}
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.root = _Element("#document", {}, None)
+        self.elements: List[_Element] = []
+        self._open: List[_Element] = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        # <td>a<td>b: the second cell closes the first (and a <tr> closes the open row)
+        while self._open[-1].tag in _IMPLIED_END and tag in _IMPLIED_END[self._open[-1].tag]:
+            self._open.pop()
+        el = _Element(tag, {k: v or "" for k, v in attrs}, self._open[-1])
+        self._open[-1].children.append(el)
+        self.elements.append(el)
+        if tag not in _VOID:
+            self._open.append(el)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in _VOID:
+            self._open.pop()
+
+    def handle_endtag(self, tag):
+        for i in range(len(self._open) - 1, 0, -1):
+            if self._open[i].tag == tag:
+                del self._open[i:]
+                return
+
+    def handle_data(self, data):
+        for el in self._open[1:]:
+            el.parts.append(data)
+
+
+def _parse(html: str) -> _TreeBuilder:
+    builder = _TreeBuilder()
+    builder.feed(html or "")
+    builder.close()
+    return builder
+
+
+_COMPOUND_RE = re.compile(
+    r"""(?P<tag>[a-zA-Z][\w-]*|\*)?
+        (?P<rest>(?:\#[\w-]+|\.[\w-]+|\[[\w-]+(?:=(?:"[^"]*"|'[^']*'|[^\]]*))?\]|:first-child|:last-child)*)$""",
+    re.X,
+)
+_PART_RE = re.compile(r"""\#([\w-]+)|\.([\w-]+)|\[([\w-]+)(?:=("[^"]*"|'[^']*'|[^\]]*))?\]|:(first|last)-child""")
+
+
+def _compound(text: str):
+    m = _COMPOUND_RE.match(text)
+    if not m or not text:
+        raise ValueError(f"Селектор не поддерживается: {text!r}")
+    tag = (m.group("tag") or "*").lower()
+    checks = []
+    for el_id, cls, attr, value, position in _PART_RE.findall(m.group("rest")):
+        if el_id:
+            checks.append(lambda e, v=el_id: e.attrs.get("id") == v)
+        elif cls:
+            checks.append(lambda e, v=cls: v in e.classes)
+        elif attr:
+            if value:
+                value = value[1:-1] if value[0] in "\"'" else value
+                checks.append(lambda e, a=attr, v=value: e.attrs.get(a) == v)
+            else:
+                checks.append(lambda e, a=attr: a in e.attrs)
+        else:
+            index = 0 if position == "first" else -1
+            checks.append(lambda e, i=index: e.parent is not None and e.parent.children[i] is e)
+    return lambda e: (tag == "*" or e.tag == tag) and all(check(e) for check in checks)
+
+
+def _complex(text: str):
+    # [(combinator, compound)] right to left: the last compound is the subject
+    tokens = text.replace(">", " > ").split()
+    steps, combinator = [], " "
+    for token in tokens:
+        if token == ">":
+            combinator = ">"
+            continue
+        steps.append((combinator, _compound(token)))
+        combinator = " "
+    if not steps or combinator == ">":
+        raise ValueError(f"Селектор не поддерживается: {text!r}")
+    return steps
+
+
+def _matches(el: _Element, steps, i: int) -> bool:
+    if not steps[i][1](el):
+        return False
+    if i == 0:
+        return True
+    if steps[i][0] == ">":
+        return el.parent is not None and _matches(el.parent, steps, i - 1)
+    ancestor = el.parent
+    while ancestor is not None:
+        if _matches(ancestor, steps, i - 1):
+            return True
+        ancestor = ancestor.parent
+    return False
+
+
+def select(tree: _TreeBuilder, selector: str) -> List[_Element]:
+    """Elements matching ``selector`` in document order (like ``querySelectorAll``)."""
+    groups = [_complex(part.strip()) for part in selector.split(",")]
+    return [el for el in tree.elements if any(_matches(el, steps, len(steps) - 1) for steps in groups)]
+
+
+def parse_total(html: str, selectors: Sequence[str]) -> str:
+    """The report total: the last numeric element of the first selector that has one."""
+    tree = _parse(html)
+    for sel in selectors:
+        candidates = [e for e in select(tree, sel) if e.text.strip() and any(ch.isdigit() for ch in e.text)]
+        if candidates:
+            return normalize_total(candidates[-1].text)
+    return ""
+
+
+def parse_table_rows(html: str, rows: str, value_columns: int) -> List[Tuple[str, List[str]]]:
+    """Rows matching ``rows`` as (first cell, the next ``value_columns`` cells)."""
+    result: List[Tuple[str, List[str]]] = []
+    for tr in select(_parse(html), rows):
+        cells = [c for c in tr.children if c.tag in ("td", "th")]
+        if not cells:
+            continue
+        name = " ".join(cells[0].text.split())
+        values = ["".join(td.text.split()) for td in cells[1 : value_columns + 1]]
+        result.append((name, values))
+    return result
@@ -0,0 +1,113 @@
+"""Declarative report definitions.
+
+A spec (``config/reports/<name>.toml``, or ``.yaml``/``.yml`` with PyYAML)
+describes everything that differs between the officemanager reports: role,
+URLs, the department ``<select>``, filters, period fields, the build button
+and how to extract values. ``ReportEngine`` executes any spec with the same
+city -> department -> date traversal.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import tomllib  # Python 3.11+
+except Exception:  # pragma: no cover
+    tomllib = None  # type: ignore
+
+try:
+    import yaml  # type: ignore
+except Exception:  # pragma: no cover
+    yaml = None  # type: ignore
+
+
+SPEC_DIR = Path(__file__).resolve().parent.parent / "config" / "reports"
+
+LAYOUTS = ("sections", "flat")
+KINDS = ("total", "table")
+
+
+class ReportSpec:
+    def __init__(self, data: Dict[str, Any], source: Optional[Path] = None) -> None:
+        self.source = source
+        self.name: str = data["name"]
+        self.title: str = data.get("title", self.name)
+        self.role_id = str(data["role_id"])
+        self.csv_file = Path(data.get("csv_file", f"reports/{self.name}.csv"))
+        self.layout: str = data.get("layout", "sections")
+        self.header: Optional[List[str]] = data.get("header")
+
+        urls = data["urls"]
+        self.select_department_url: str = urls["select_department"]
+        self.back_to_select_role_url: str = urls["back_to_select_role"]
+        self.report_url: str = urls["report"]
+
+        depts = data.get("departments", {})
+        self.department_select: str = depts.get("select_id", "UnitId")
+        self.department_widget: str = depts.get("widget", "sumo")
+        self.department_exclude = [x.lower() for x in depts.get("exclude", [])]
+        self.departments_required: bool = bool(depts.get("required", False))
+
+        filters = data.get("filters", {})
+        self.select_all: List[str] = list(filters.get("select_all", []))
+        self.filter_values: Dict[str, str] = dict(filters.get("values", {}))
+        self.wait_for: List[str] = list(filters.get("wait_for", []))
+        # per_build: filters are re-applied before every build, not once per page load
+        self.filters_per_build: bool = bool(filters.get("per_build", False))
+
+        period = data.get("period", {})
+        self.period_start: str = period.get("start_id", "StartDate")
+        self.period_end: str = period.get("end_id", "EndDate")
+        self.date_format: str = period.get("format", "%d.%m.%Y")
+
+        build = data.get("build", {})
+        self.build_buttons: List[str] = list(build.get("buttons", ['[name="reportButton"], #buildReportButton']))
+        self.build_js: str = build.get("js_function", "buildReport")
+        self.container: str = build.get("container", "#report")
+        self.observe: str = build.get("observe", self.container)
+        self.observe_parent: bool = bool(build.get("observe_parent", False))
+
+        extract = data.get("extract", {})
+        self.kind: str = extract.get("kind", "total")
+        self.total_selectors: List[str] = list(extract.get("selectors", ["tbody td"]))
+        self.table_rows: str = extract.get("rows", "table tbody tr")
+        # Names of the value cells after the first one (Parquet/JSONL fields); the count follows them
+        self.columns: List[str] = list(extract.get("columns", []))
+        self.value_columns: int = int(extract.get("value_columns", len(self.columns) or 5))
+        if not self.columns:
+            self.columns = [f"value_{i}" for i in range(1, self.value_columns + 1)]
+        # Decimal places of the typed outputs
+        self.scale: int = int(extract.get("scale", 3 if self.kind == "table" else 2))
+
+        if self.layout not in LAYOUTS:
+            raise ValueError(f"{self.name}: layout должен быть одним из {LAYOUTS}")
+        if self.kind not in KINDS:
+            raise ValueError(f"{self.name}: extract.kind должен быть одним из {KINDS}")
+        if len(self.columns) != self.value_columns:
+            raise ValueError(f"{self.name}: extract.columns должно содержать value_columns ({self.value_columns}) имён")
+
+    def __repr__(self) -> str:
+        return f"ReportSpec({self.name!r}, role={self.role_id}, url={self.report_url})"
+
+
+def load_spec(path) -> ReportSpec:
+    """Load a spec file; a bare name (``"office"``) is looked up in ``config/reports``."""
+    path = Path(path)
+    if not path.suffix:
+        for ext in (".toml", ".yaml", ".yml"):
+            if (SPEC_DIR / (path.name + ext)).exists():
+                path = SPEC_DIR / (path.name + ext)
+                break
+    if path.suffix == ".toml":
+        if tomllib is None:
+            raise RuntimeError("Для TOML-спецификаций нужен Python 3.11+")
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    elif path.suffix in (".yaml", ".yml"):
+        if yaml is None:
+            raise RuntimeError("Для YAML-спецификаций нужен PyYAML")
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f)
+    else:
+        raise ValueError(f"Неизвестный формат спецификации: {path}")
+    return ReportSpec(data, source=path)
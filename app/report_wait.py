@@ -0,0 +1,207 @@
+"""Event-driven wait for a rebuilt report.
+
+``install_report_observer()`` puts a MutationObserver on the report
+container before the build button is clicked; ``await_report_change()``
+then blocks in a single ``execute_async_script`` call until new content
+carrying the report value (an element matching the value selector) is
+inserted or edited (or the timeout expires) and returns the new markup in
+the same round trip. Other mutations — a spinner, a cleared container,
+counters — are ignored and observing continues.
+
+The generation-token helpers below do not compare content at all, so two
+identical consecutive results (e.g. ``0,00``) do not stall until timeout.
+"""
+
+from typing import Optional
+
+
+INSTALL_OBSERVER_JS = """
+var sel = arguments[0];
+var useParent = arguments[1];
+var valueSel = arguments[2];
+var old = window.__reportWatch;
+if (old && old.observer) { try { old.observer.disconnect(); } catch (e) {} }
+var target = document.querySelector(sel);
+if (target && useParent) target = target.parentElement;
+if (!target) { window.__reportWatch = null; return false; }
+var w = {target: target, done: false, callback: null, observer: null};
+function carriesValue(node) {
+  if (!valueSel) return true;
+  var el = node.nodeType === 1 ? node : node.parentElement;
+  if (!el) return false;
+  if (el.matches(valueSel) || el.closest(valueSel)) return true;
+  return node.nodeType === 1 && !!el.querySelector(valueSel);
+}
+w.observer = new MutationObserver(function (mutations) {
+  if (w.done) return;
+  var hit = false;
+  for (var i = 0; i < mutations.length && !hit; i++) {
+    var m = mutations[i];
+    if (m.type === 'characterData') { hit = carriesValue(m.target); continue; }
+    for (var j = 0; j < m.addedNodes.length && !hit; j++) {
+      // Detached by a later mutation of the same batch: not the final content
+      if (m.addedNodes[j].isConnected !== false) hit = carriesValue(m.addedNodes[j]);
+    }
+  }
+  if (!hit) return;
+  w.done = true;
+  w.observer.disconnect();
+  if (w.callback) { var cb = w.callback; w.callback = null; cb(w.target.innerHTML); }
+});
+w.observer.observe(target, {childList: true, subtree: true, characterData: true});
+window.__reportWatch = w;
+return true;
+"""
+
+AWAIT_CHANGE_JS = """
+var timeoutMs = arguments[0];
+var done = arguments[arguments.length - 1];
+var w = window.__reportWatch;
+if (!w) { done(null); return; }
+if (w.done) { done(w.target.innerHTML); return; }
+w.callback = done;
+setTimeout(function () {
+  if (w.callback) { w.callback = null; w.observer.disconnect(); done(null); }
+}, timeoutMs);
+"""
+
+CHECK_CHANGE_JS = """
+var w = window.__reportWatch;
+return !!(w && w.done);
+"""
+
+
+def install_report_observer(driver, selector: str, parent: bool = False, value_selector: Optional[str] = None) -> bool:
+    """Start watching ``selector`` (or its parent, for elements that get replaced).
+
+    Only mutations that bring in ``value_selector`` elements count (any
+    mutation if it is None). Must be called before the build click; returns
+    False if nothing matched.
+    """
+    try:
+        return bool(driver.execute_script(INSTALL_OBSERVER_JS, selector, parent, value_selector))
+    except Exception:
+        return False
+
+
+def report_changed(driver) -> bool:
+    """Non-blocking check of the installed observer (per tab: each has its own window)."""
+    try:
+        return bool(driver.execute_script(CHECK_CHANGE_JS))
+    except Exception:
+        return False
+
+
+def await_report_change(driver, timeout: float = 10.0) -> Optional[str]:
+    """Return the container's new innerHTML, or None on timeout/error."""
+    try:
+        driver.set_script_timeout(timeout + 5)
+        return driver.execute_async_script(AWAIT_CHANGE_JS, int(timeout * 1000))
+    except Exception:
+        return None
+
+
+# Generation token: numbers every XHR the page sends and drops a hidden marker
+# node into the container. The build is complete once a report request — one
+# sent after arming to the action of the report form — has finished, even if
+# the new result is byte-for-byte identical to the previous one; for pages that
+# load the report from elsewhere, once the marker is gone (content replaced)
+# while no report request is in flight (a spinner swapped in is not the end). Requests already in flight when
+# arming (change events of the period fields, select pickers, analytics) and
+# requests to other URLs do not count.
+ARM_GENERATION_JS = """
+var sel = arguments[0], fieldId = arguments[1];
+var g = window.__reportGen;
+if (!g) {
+  g = window.__reportGen = {sent: 0, finished: [], inflight: {}, match: null};
+  var origOpen = XMLHttpRequest.prototype.open;
+  XMLHttpRequest.prototype.open = function (method, url) {
+    try { this.__reportPath = new URL(url, location.href).pathname.toLowerCase(); } catch (e) { this.__reportPath = ''; }
+    return origOpen.apply(this, arguments);
+  };
+  var origSend = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function () {
+    var seq = ++g.sent, path = this.__reportPath;
+    g.inflight[seq] = path;
+    // loadend fires after the page's own load handlers have updated the DOM
+    this.addEventListener('loadend', function () {
+      delete g.inflight[seq];
+      g.finished.push({seq: seq, path: path});
+      if (g.finished.length > 50) g.finished.shift();
+    });
+    return origSend.apply(this, arguments);
+  };
+}
+var field = fieldId && document.getElementById(fieldId);
+var t = document.querySelector(sel);
+var form = (field && field.form) || (t && t.closest('form')) || document.querySelector('form');
+g.match = new URL((form && form.getAttribute('action')) || location.href, location.href).pathname.toLowerCase();
+var stale = document.querySelectorAll('[data-report-stale]');
+for (var i = 0; i < stale.length; i++) stale[i].remove();
+if (t) {
+  var m = document.createElement(t.tagName === 'TBODY' ? 'tr' : 'span');
+  m.setAttribute('data-report-stale', '1');
+  m.style.display = 'none';
+  t.appendChild(m);
+}
+return {token: g.sent, marker: !!t, match: g.match};
+"""
+
+GENERATION_DONE_JS = """
+function reportDone(token, marker) {
+  var g = window.__reportGen;
+  if (!g) return true;
+  if (g.finished.some(function (r) { return r.seq > token && r.path === g.match; })) return true;
+  var pending = Object.keys(g.inflight).some(function (k) { return +k > token && g.inflight[k] === g.match; });
+  return marker && !pending && !document.querySelector('[data-report-stale]');
+}
+"""
+
+CHECK_GENERATION_JS = GENERATION_DONE_JS + """
+return reportDone(arguments[0], arguments[1]);
+"""
+
+AWAIT_GENERATION_JS = GENERATION_DONE_JS + """
+var token = arguments[0], marker = arguments[1], timeoutMs = arguments[2];
+var done = arguments[arguments.length - 1];
+var deadline = Date.now() + timeoutMs;
+(function check() {
+  if (reportDone(token, marker)) { done(true); return; }
+  if (Date.now() > deadline) { done(false); return; }
+  setTimeout(check, 10);
+})();
+"""
+
+
+def arm_generation(driver, selector: str, form_field: Optional[str] = None) -> Optional[dict]:
+    """Record the request generation before the build click.
+
+    The report request is the one sent to the action of the form that owns
+    ``form_field`` (the period start field), else of the container's form.
+    Returns the token to pass to ``generation_done()``/``await_generation()``,
+    or None if the page could not be instrumented.
+    """
+    try:
+        armed = driver.execute_script(ARM_GENERATION_JS, selector, form_field)
+    except Exception:
+        return None
+    return armed if isinstance(armed, dict) else None
+
+
+def generation_done(driver, armed: dict) -> bool:
+    """Non-blocking check (one small round trip, no page content)."""
+    try:
+        return bool(driver.execute_script(CHECK_GENERATION_JS, armed["token"], armed["marker"]))
+    except Exception:
+        return False
+
+
+def await_generation(driver, armed: dict, timeout: float = 10.0) -> bool:
+    """Block in one async script call until the armed build completes; False on timeout."""
+    try:
+        driver.set_script_timeout(timeout + 5)
+        return bool(
+            driver.execute_async_script(AWAIT_GENERATION_JS, armed["token"], armed["marker"], int(timeout * 1000))
+        )
+    except Exception:
+        return False
@@ -0,0 +1,225 @@
+"""Network resource policy for the report browsers.
+
+The scripts only need the app's own HTML, scripts and XHRs. With
+``RESOURCE_POLICY=1`` Chrome is started with the ``eager`` page-load strategy
+(WebDriver returns at DOMContentLoaded instead of waiting for every image and
+font), images disabled, and a DevTools ``Network.setBlockedURLs`` list for
+images, fonts, analytics and other third-party scripts. Every tab is a
+separate DevTools target: tabs opened later get the list through
+``ResourceStats.attach_tab()``.
+
+Block patterns never apply to scripts and styles of ``ALLOW_HOSTS`` (by
+default the officemanager app and the login host): a pattern that would
+match one of them is dropped with a warning.
+
+Blocked requests are counted from the performance log
+(``Network.loadingFailed`` with a ``blockedReason``). A blocked request has
+no size, so avoided bytes are estimated from the sizes the same URLs had
+when they were loaded: ``RESOURCE_POLICY=measure`` blocks nothing, reports
+what the policy would block and records those sizes in ``RESOURCE_SIZES``.
+"""
+
+import json
+import os
+import weakref
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from cdp_capture import add_log_listener, enable_network_log, read_performance_log
+
+
+DEFAULT_BLOCK = (
+    # Images and fonts (CSS backgrounds included)
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.bmp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    # Analytics, tag managers, chat widgets
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*mc.yandex.ru*", "*yandex.ru/metrika*", "*facebook.net*", "*hotjar.com*",
+    "*sentry.io*", "*intercom.io*", "*intercomcdn.com*", "*jivosite.com*",
+    "*fonts.googleapis.com*", "*fonts.gstatic.com*",
+)
+DEFAULT_ALLOW_HOSTS = ("officemanager.dodopizza.ru", "auth.dodois.io")
+
+
+def _env_list(name: str, default) -> List[str]:
+    raw = os.environ.get(name)
+    if raw is None:
+        return list(default)
+    return [x.strip() for x in raw.split(",") if x.strip()]
+
+
+class ResourcePolicy:
+    def __init__(
+        self,
+        block: List[str],
+        allow_hosts: List[str],
+        images: bool = False,
+        page_load_strategy: str = "eager",
+        sizes_file: Optional[Path] = None,
+        enforce: bool = True,
+    ) -> None:
+        self.allow_hosts = allow_hosts
+        self.block = [p for p in block if self._safe(p)]
+        self.images = images
+        self.page_load_strategy = page_load_strategy
+        self.sizes_file = sizes_file
+        self.enforce = enforce
+
+    @classmethod
+    def from_env(cls) -> Optional["ResourcePolicy"]:
+        """The policy configured by RESOURCE_POLICY / BLOCK_URLS / ALLOW_HOSTS, or None."""
+        mode = os.environ.get("RESOURCE_POLICY", "0")
+        if mode not in ("1", "measure"):
+            return None
+        return cls(
+            block=_env_list("BLOCK_URLS", DEFAULT_BLOCK) + _env_list("BLOCK_URLS_EXTRA", ()),
+            allow_hosts=_env_list("ALLOW_HOSTS", DEFAULT_ALLOW_HOSTS),
+            images=os.environ.get("LOAD_IMAGES", "0") == "1",
+            page_load_strategy=os.environ.get("PAGE_LOAD_STRATEGY", "eager"),
+            sizes_file=Path(os.environ.get("RESOURCE_SIZES", "reports/resource_sizes.json")),
+            enforce=mode == "1",
+        )
+
+    def _safe(self, pattern: str) -> bool:
+        for host in self.allow_hosts:
+            for sample in (f"https://{host}/js/app.js", f"https://{host}/css/site.css", f"https://{host}/"):
+                if fnmatchcase(sample, pattern):
+                    print(f"[NET] Шаблон {pattern!r} задевает скрипты {host} — пропущен")
+                    return False
+        return True
+
+    def apply_options(self, options) -> None:
+        """Chrome options part: page-load strategy, images, performance log."""
+        # Blocked requests are counted from the network events
+        enable_network_log(options)
+        if not self.enforce:
+            return
+        if self.page_load_strategy:
+            options.page_load_strategy = self.page_load_strategy
+        if not self.images:
+            options.add_argument("--blink-settings=imagesEnabled=false")
+
+    def attach(self, driver) -> Optional["ResourceStats"]:
+        """DevTools part: install the block list and start counting."""
+        if not _install(driver, self.block, self.enforce):
+            return None
+        stats = ResourceStats(driver, self.block, self.sizes_file, self.enforce)
+        _stats[driver] = stats
+        if self.enforce:
+            print(f"[NET] Блокируется шаблонов: {len(self.block)}; загрузка страниц: {self.page_load_strategy}")
+        else:
+            print("[NET] RESOURCE_POLICY=measure: ничего не блокируется, размеры запоминаются")
+        return stats
+
+
+def _install(driver, block: List[str], enforce: bool) -> bool:
+    # Applies to the current tab's target only
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        if enforce:
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": block})
+    except Exception as e:
+        print(f"[NET] Блокировка запросов недоступна: {e}")
+        return False
+    return True
+
+
+class ResourceStats:
+    """Counts blocked and loaded requests of one driver from its performance log."""
+
+    def __init__(self, driver, block: List[str], sizes_file: Optional[Path] = None, enforce: bool = True) -> None:
+        self.driver = driver
+        self.block = block
+        self.enforce = enforce
+        self.sizes_file = sizes_file
+        self.sizes: Dict[str, int] = {}
+        if sizes_file is not None and sizes_file.exists():
+            try:
+                self.sizes = {str(k): int(v) for k, v in json.loads(sizes_file.read_text("utf-8")).items()}
+            except Exception:
+                self.sizes = {}
+        self.urls: Dict[str, str] = {}
+        self.blocked = 0
+        self.blocked_bytes = 0
+        self.unknown = 0
+        self.loaded = 0
+        self.loaded_bytes = 0
+        # Loaded requests the block list would have stopped (measure mode)
+        self.would = 0
+        self.would_bytes = 0
+        self.learned = False
+        add_log_listener(driver, self.feed)
+
+    def feed(self, entries: List[dict]) -> None:
+        for entry in entries:
+            try:
+                msg = json.loads(entry["message"])["message"]
+            except Exception:
+                continue
+            method = msg.get("method")
+            params = msg.get("params") or {}
+            rid = params.get("requestId")
+            if method == "Network.requestWillBeSent":
+                self.urls[rid] = (params.get("request") or {}).get("url", "")
+            elif method == "Network.loadingFailed":
+                url = self.urls.pop(rid, "")
+                if params.get("blockedReason"):
+                    self.blocked += 1
+                    if url in self.sizes:
+                        self.blocked_bytes += self.sizes[url]
+                    else:
+                        self.unknown += 1
+            elif method == "Network.loadingFinished":
+                url = self.urls.pop(rid, "")
+                size = int(params.get("encodedDataLength") or 0)
+                self.loaded += 1
+                self.loaded_bytes += size
+                # Sizes of would-be-blocked URLs feed the estimate of later runs
+                if any(fnmatchcase(url, p) for p in self.block):
+                    self.would += 1
+                    self.would_bytes += size
+                    if size:
+                        self.sizes[url] = size
+                        self.learned = True
+
+    def attach_tab(self) -> None:
+        """Install the block list in the tab the driver has just switched to."""
+        _install(self.driver, self.block, self.enforce)
+
+    def poll(self) -> None:
+        try:
+            read_performance_log(self.driver)
+        except Exception:
+            pass
+
+    def save(self) -> None:
+        if not self.learned or self.sizes_file is None:
+            return
+        try:
+            self.sizes_file.parent.mkdir(parents=True, exist_ok=True)
+            self.sizes_file.write_text(json.dumps(self.sizes), "utf-8")
+        except Exception:
+            pass
+
+    def summary(self) -> str:
+        self.poll()
+        self.save()
+        avoided = f"~{self.blocked_bytes / 1024:.0f} КБ"
+        if self.unknown:
+            avoided += f" (+{self.unknown} запросов без известного размера)"
+        line = (
+            f"[NET] Заблокировано запросов: {self.blocked}, сэкономлено {avoided}; "
+            f"загружено: {self.loaded} запросов, {self.loaded_bytes / 1024:.0f} КБ"
+        )
+        if self.would:
+            line += f"; из них под блокировку попали бы {self.would} ({self.would_bytes / 1024:.0f} КБ)"
+        return line
+
+
+_stats: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def resource_stats(driver) -> Optional[ResourceStats]:
+    """Stats of a driver started with a resource policy, if any."""
+    return _stats.get(driver) if driver is not None else None
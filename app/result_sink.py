@@ -0,0 +1,156 @@
+"""Buffered CSV result sink.
+
+Rows are handed to a background writer thread through a queue and written
+through one long-lived file handle, so the browser loop never waits on file
+I/O. The thread encodes rows itself and counts the bytes it writes, so the
+current file size is known without asking the file. The writer flushes when ``batch_rows`` rows are buffered or
+``flush_interval`` seconds have passed.
+
+Callbacks queued with ``after_flush()`` run on the writer thread once every
+row queued before them has been flushed and fsynced (at the next regular
+flush, not immediately); each receives the file size just after those rows.
+``on_flush`` then runs once for that flush. The checkpoint uses this to
+record only rows that are already on disk, with one save per batch.
+"""
+
+import codecs
+import csv
+import io
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+
+_STOP = object()
+
+
+class CsvSink:
+    def __init__(
+        self,
+        path: Path,
+        delimiter: str = ";",
+        encoding: str = "utf-8-sig",
+        batch_rows: int = 200,
+        flush_interval: float = 1.0,
+        on_flush: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.batch_rows = max(1, batch_rows)
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.queue: "queue.Queue" = queue.Queue()
+        self.error: Optional[BaseException] = None
+        self._file: Optional[io.BufferedWriter] = None
+        # File size after the rows written so far (maintained by the writer thread)
+        self._offset = 0
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- Producer side ----------
+    def reset(self, header: Optional[Sequence[str]] = None) -> None:
+        """Truncate the file (UTF-8 BOM, optional header row) and open it for appending."""
+        self.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding=self.encoding, newline="") as f:
+            if header is not None:
+                csv.writer(f, delimiter=self.delimiter).writerow(header)
+        self.open()
+
+    def open(self) -> None:
+        """Open the existing file for appending (e.g. after a resume truncated it)."""
+        if self._thread is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._offset = os.fstat(self._file.fileno()).st_size
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="csv-sink", daemon=True)
+        self._thread.start()
+
+    def write_many(self, rows: Iterable[Sequence[str]]) -> None:
+        self._check()
+        self.queue.put([list(r) for r in rows])
+
+    def after_flush(self, callback: Callable[[int], None]) -> None:
+        """Run ``callback(size)`` once all rows queued so far are durable."""
+        self._check()
+        self.queue.put(callback)
+
+    def close(self) -> None:
+        if self._thread is None:
+            return
+        self.queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._check()
+
+    def _check(self) -> None:
+        if self.error is not None:
+            raise RuntimeError(f"Запись в {self.path} не удалась: {self.error}")
+
+    # ---------- Writer thread ----------
+    def _run(self) -> None:
+        text = io.StringIO()
+        writer = csv.writer(text, delimiter=self.delimiter)
+        encoder = codecs.getincrementalencoder(self.encoding)()
+        # Appending to a non-empty file: no second BOM (as a text-mode append would do)
+        if self._offset:
+            encoder.setstate(0)
+        buffered = 0
+        callbacks: List[Tuple[Callable[[int], None], int]] = []
+        last_flush = time.monotonic()
+        while True:
+            pending = buffered or callbacks
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self.queue.get(timeout=timeout if pending else None)
+            except queue.Empty:
+                item = None
+            force = item is _STOP
+            if isinstance(item, list):
+                try:
+                    text.seek(0)
+                    text.truncate()
+                    writer.writerows(item)
+                    data = encoder.encode(text.getvalue())
+                    self._file.write(data)
+                    self._offset += len(data)
+                except Exception as e:
+                    self.error = e
+                buffered += len(item)
+            elif item is not None and item is not _STOP:
+                callbacks.append((item, self._offset))
+            due = buffered >= self.batch_rows or time.monotonic() - last_flush >= self.flush_interval
+            if force or (pending or item is not None) and due:
+                if buffered or force:
+                    self._flush()
+                buffered = 0
+                last_flush = time.monotonic()
+                for cb, size in callbacks:
+                    try:
+                        cb(size)
+                    except Exception as e:
+                        print(f"[WARN] Ошибка обработчика записи: {e}")
+                if callbacks and self.on_flush is not None:
+                    try:
+                        self.on_flush()
+                    except Exception as e:
+                        print(f"[WARN] Ошибка обработчика записи: {e}")
+                callbacks = []
+            if item is _STOP:
+                return
+
+    def _flush(self) -> None:
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except Exception as e:
+            self.error = e
+
@@ -0,0 +1,113 @@
+"""Run any report described by a spec file.
+
+    python app/run_report.py office
+    python app/run_report.py config/reports/my_report.toml --resume
+    python app/run_report.py project office
+
+A bare name is looked up in ``config/reports``. Several specs are collected
+in one pass (``run_together``): one Chrome, every city visited once, each
+report written to its own file. The speed-up switches of the other
+scripts (CDP_CAPTURE, OBSERVER_WAIT, INCREMENTAL, PARQUET_DIR, JSONL_OUT,
+CSV_FLUSH_*, FAST_SWITCH, CLONE_PROFILE…) apply here as well.
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from browser import build_chrome, env_bool
+from checkpoint import Checkpoint, install_signal_handlers
+from chrome_daemon import lease_browser
+from chrome_profile import clone_profile, profile_tmpfs, stage_profile
+from jsonl_stream import JsonlStream
+from phase_timing import PhaseTimer
+from report_engine import ReportEngine, run_together
+from report_spec import ReportSpec, load_spec
+from session_state import session_file
+
+
+def make_engine(driver, spec: ReportSpec, stream: Optional[JsonlStream], resume: bool, single: bool) -> ReportEngine:
+    # The output file comes from the spec (docker-compose pins CSV_FILE to project.csv);
+    # CHECKPOINT_FILE only makes sense for a single report
+    csv_file = Path(spec.csv_file)
+    csv_file.parent.mkdir(parents=True, exist_ok=True)
+    checkpoint_file = (os.environ.get("CHECKPOINT_FILE") if single else None) or f"reports/{spec.name}.checkpoint.json"
+    parquet_dir = os.environ.get("PARQUET_DIR", "")
+    return ReportEngine(
+        driver,
+        spec,
+        csv_file=csv_file,
+        slow_delay=float(os.environ.get("SLOW_DELAY", "0") or "0"),
+        cdp_capture=env_bool("CDP_CAPTURE", False),
+        observer_wait=env_bool("OBSERVER_WAIT", False),
+        report_timeout=float(os.environ.get("REPORT_TIMEOUT", "10") or "10"),
+        highlight=env_bool("HIGHLIGHT", not env_bool("HEADLESS", True)),
+        bulk_read=env_bool("BULK_READ", True),
+        ledger_path=Path(os.environ.get("LEDGER_PATH", "reports/ledger.sqlite"))
+        if env_bool("INCREMENTAL", False)
+        else None,
+        final_after_days=int(os.environ.get("FINAL_AFTER_DAYS", "2") or "2"),
+        parquet_dir=Path(parquet_dir) if parquet_dir else None,
+        stream=stream,
+        checkpoint=Checkpoint(Path(checkpoint_file), csv_file),
+        resume=resume,
+        csv_flush_rows=int(os.environ.get("CSV_FLUSH_ROWS", "200") or "200"),
+        csv_flush_interval=float(os.environ.get("CSV_FLUSH_INTERVAL", "1") or "1"),
+        fast_switch=env_bool("FAST_SWITCH", False),
+        timer=PhaseTimer.from_env(spec.name),
+    )
+
+
+def main(argv) -> int:
+    args = [a for a in argv if not a.startswith("--")]
+    if not args:
+        print("Использование: python app/run_report.py <имя или путь к спецификации>... [--resume]", file=sys.stderr)
+        return 2
+    specs = [load_spec(a) for a in args]
+
+    # Opened first: with JSONL_OUT=- every later print goes to stderr
+    jsonl_out = os.environ.get("JSONL_OUT", "")
+    stream = JsonlStream(jsonl_out) if jsonl_out else None
+
+    user_data_dir = Path(os.environ.get("USER_DATA_DIR", "/profile"))
+    user_data_dir.mkdir(parents=True, exist_ok=True)
+    headless = env_bool("HEADLESS", True)
+    resume = "--resume" in argv or env_bool("RESUME", False)
+
+    print(f"[run] {specs!r}; headless={headless}; profile={user_data_dir}", flush=True)
+
+    try:
+        clone_dir = os.environ.get("PROFILE_CLONE_DIR")
+        ram_dir = profile_tmpfs()
+        own_profile = session_file() is None and lease_browser() is None
+        if env_bool("CLONE_PROFILE", False) and own_profile:
+            user_data_dir = clone_profile(user_data_dir, Path(clone_dir) if clone_dir else ram_dir)
+        elif ram_dir is not None and own_profile:
+            user_data_dir = stage_profile(user_data_dir, ram_dir)
+        driver = build_chrome(headless=headless, user_data_dir=user_data_dir)
+    except Exception as e:
+        print(f"[run] Failed to launch Chrome: {e}", file=sys.stderr)
+        return 2
+
+    engines: List[ReportEngine] = []
+    try:
+        for spec in specs:
+            engines.append(make_engine(driver, spec, stream, resume, single=len(specs) == 1))
+        install_signal_handlers(*(e.checkpoint for e in engines))
+        if len(engines) == 1:
+            return engines[0].run()
+        return run_together(engines)
+    finally:
+        for engine in engines:
+            engine.close_output()
+        if stream is not None:
+            stream.close()
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,165 @@
+"""Compact session file instead of the full Chrome profile.
+
+An authenticated ``./profile`` carries component data (WidevineCdm,
+WasmTtsEngine, ZxcvbnData, AutofillStates, Crowd Deny…) that Chrome opens
+and scans at every start. The reports only need the auth cookies and local storage of
+the officemanager app and the login host:
+
+    python app/session_state.py export reports/session.json
+
+starts Chrome on the authenticated profile and writes those cookies
+(``Network.getAllCookies``) and the local storage of ``SESSION_HOSTS`` to a
+small JSON file (mode 0600: it is as secret as the profile). With
+``SESSION_FILE=reports/session.json`` every script starts Chrome on a fresh
+empty profile instead and injects the state: cookies via
+``Network.setCookies``, local storage via a script that runs before the
+app's own scripts on its origin.
+"""
+
+import datetime as dt
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_HOSTS = ("officemanager.dodopizza.ru", "auth.dodois.io")
+
+# Fields accepted by Network.setCookies (CookieParam)
+COOKIE_PARAMS = (
+    "name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires",
+    "priority", "sourceScheme", "sourcePort",
+)
+
+RESTORE_STORAGE_JS = """
+(function (state) {
+  var items = state[location.origin];
+  if (!items) return;
+  try {
+    if (sessionStorage.getItem('__session_restored')) return;
+    Object.keys(items).forEach(function (k) { if (localStorage.getItem(k) === null) localStorage.setItem(k, items[k]); });
+    sessionStorage.setItem('__session_restored', '1');
+  } catch (e) {}
+})(%s);
+"""
+
+
+def session_hosts() -> List[str]:
+    raw = os.environ.get("SESSION_HOSTS")
+    return [h.strip() for h in raw.split(",") if h.strip()] if raw else list(DEFAULT_HOSTS)
+
+
+def session_file() -> Optional[Path]:
+    """SESSION_FILE, if set and present: start Chrome on an empty profile with this state."""
+    raw = os.environ.get("SESSION_FILE")
+    if not raw:
+        return None
+    path = Path(raw)
+    if not path.exists():
+        print(f"[SESSION] {path} не найден — использую профиль")
+        return None
+    return path
+
+
+def _host_matches(domain: str, hosts: List[str]) -> bool:
+    domain = domain.lstrip(".").lower()
+    return any(h == domain or h.endswith("." + domain) or domain.endswith("." + h) for h in hosts)
+
+
+def export_session(driver, path: Path, hosts: List[str]) -> dict:
+    """Write the cookies and local storage of ``hosts`` from ``driver`` to ``path``."""
+    driver.execute_cdp_cmd("Network.enable", {})
+    cookies = driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", [])
+    cookies = [c for c in cookies if _host_matches(c.get("domain", ""), hosts)]
+
+    storage: Dict[str, Dict[str, str]] = {}
+    for host in hosts:
+        try:
+            driver.get(f"https://{host}/")
+            items = driver.execute_script(
+                "var o={}; for (var i=0;i<localStorage.length;i++){ var k=localStorage.key(i); o[k]=localStorage.getItem(k); }"
+                "return [location.origin, o];"
+            )
+        except Exception as e:
+            print(f"[SESSION] localStorage {host} не прочитан: {e}")
+            continue
+        origin, values = items
+        if values and _host_matches(origin.split("://", 1)[-1], hosts):
+            storage.setdefault(origin, {}).update(values)
+
+    state = {
+        "version": 1,
+        "created": dt.datetime.now().isoformat(timespec="seconds"),
+        "hosts": hosts,
+        "cookies": cookies,
+        "local_storage": storage,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return state
+
+
+def import_session(driver, path: Path) -> None:
+    """Inject a session file into a freshly started Chrome (before the first navigation)."""
+    state = json.loads(Path(path).read_text("utf-8"))
+    now = time.time()
+    cookies = []
+    for c in state.get("cookies", []):
+        param = {k: c[k] for k in COOKIE_PARAMS if k in c}
+        if not param.get("domain", ".").startswith("."):
+            # Host-only cookie: set by URL so it does not widen to subdomains
+            param["url"] = f"https://{param.pop('domain')}{param.get('path', '/')}"
+        if c.get("session") or param.get("expires", -1) <= 0:
+            param.pop("expires", None)
+        elif param["expires"] < now:
+            continue
+        cookies.append(param)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+    storage = state.get("local_storage") or {}
+    if storage:
+        driver.execute_cdp_cmd(
+            "Page.addScriptToEvaluateOnNewDocument",
+            {"source": RESTORE_STORAGE_JS % json.dumps(storage, ensure_ascii=False)},
+        )
+    expired = len(state.get("cookies", [])) - len(cookies)
+    print(
+        f"[SESSION] {path}: cookies {len(cookies)}"
+        + (f" (просрочено {expired})" if expired else "")
+        + f", localStorage {sum(len(v) for v in storage.values())} ключей; создан {state.get('created')}"
+    )
+
+
+def main(argv) -> int:
+    if not argv or argv[0] != "export":
+        print("Использование: python app/session_state.py export [файл]", file=sys.stderr)
+        return 2
+    # Imported here: building Chrome pulls selenium, which the helpers above do not need
+    from browser import build_chrome, env_bool
+
+    path = Path(argv[1] if len(argv) > 1 else os.environ.get("SESSION_FILE", "reports/session.json"))
+    user_data_dir = Path(os.environ.get("USER_DATA_DIR", "/profile"))
+    # The export must read the real profile, not a previous session file
+    os.environ.pop("SESSION_FILE", None)
+    driver = build_chrome(headless=env_bool("HEADLESS", True), user_data_dir=user_data_dir)
+    try:
+        state = export_session(driver, path, session_hosts())
+    finally:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+    print(
+        f"[SESSION] Сохранено в {path}: cookies {len(state['cookies'])}, "
+        f"localStorage {sum(len(v) for v in state['local_storage'].values())} ключей"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
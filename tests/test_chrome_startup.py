@@ -0,0 +1,60 @@
+"""chromedriver resolution with fake Chrome/chromedriver binaries."""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+import chrome_startup  # noqa: E402
+
+
+class ResolveChromedriverTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.cache = self.dir / "chromedriver.json"
+        self.env = {
+            "CHROME_BIN": self.binary("chrome", "120.0.6099.109"),
+            "CHROMEDRIVER_CACHE": str(self.cache),
+            "CHROMEDRIVER_DOWNLOAD": "0",
+            "PATH": str(self.dir),
+        }
+
+    def binary(self, name: str, version: str) -> str:
+        path = self.dir / name
+        path.write_text(f"#!/bin/sh\necho 'Fake {version}'\n")
+        path.chmod(0o755)
+        return str(path)
+
+    def resolve(self, **env) -> str:
+        with mock.patch.dict(os.environ, dict(self.env, **env), clear=True), mock.patch.object(
+            chrome_startup, "DEBIAN_DRIVERS", ()
+        ):
+            return chrome_startup.resolve_chromedriver()
+
+    def test_pinned_driver_is_used_despite_mismatch(self):
+        pinned = self.binary("pinned-driver", "119.0.6045.105")
+        self.binary("chromedriver", "120.0.6099.109")
+        self.assertEqual(self.resolve(CHROMEDRIVER=pinned), pinned)
+        self.assertFalse(self.cache.exists())
+
+    def test_missing_pinned_driver_fails(self):
+        with self.assertRaises(RuntimeError):
+            self.resolve(CHROMEDRIVER=str(self.dir / "missing"))
+
+    def test_matching_driver_is_cached(self):
+        driver = self.binary("chromedriver", "120.0.6099.109")
+        self.assertEqual(self.resolve(), driver)
+        self.assertTrue(self.cache.exists())
+
+    def test_mismatched_fallback_is_not_cached(self):
+        driver = self.binary("chromedriver", "119.0.6045.105")
+        self.assertEqual(self.resolve(), driver)
+        self.assertFalse(self.cache.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""DirectReportClient against a local stand-in of the Debiting endpoint.
+
+Run with ``python -m pytest tests`` (or ``python -m unittest discover tests``).
+"""
+
+import datetime as dt
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+# The scripts import their siblings from app/ directly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from direct_report import DirectReportClient, SessionRejected  # noqa: E402
+from report_html import parse_total  # noqa: E402
+
+TOTAL_SELECTORS = ["tbody td.totalValue", "tfoot td", "tbody tr:last-child td:last-child", "tbody td"]
+
+
+class StandInReport(BaseHTTPRequestHandler):
+    """/report answers a total that depends on the posted date, /expired redirects to login."""
+
+    posted: list = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8")
+        if self.path == "/expired":
+            self.send_response(302)
+            self.send_header("Location", "/Account/Login")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        fields = parse_qsl(body, keep_blank_values=True)
+        self.posted.append((fields, self.headers.get("Cookie", ""), self.headers.get("X-Requested-With", "")))
+        day = dict(fields).get("StartDate", "")[:2]
+        html = (
+            '<table class="table"><tbody><tr><td>Итого</td>'
+            f'<td class="totalValue">1\xa0{day},50 ₽</td></tr></tbody></table>'
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(html)))
+        self.end_headers()
+        self.wfile.write(html)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetchTotalsTest(unittest.TestCase):
+    def setUp(self):
+        StandInReport.posted = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInReport)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.form = {
+            "action": self.base + "/report",
+            "method": "POST",
+            "startName": "StartDate",
+            "endName": "EndDate",
+            # The captured form still carries the dates that were on the page
+            "fields": [("UnitId", "42"), ("StartDate", "01.01.2020"), ("EndDate", "31.01.2020"), ("reportButton", "")],
+            "referer": self.base + "/Reports/Debiting",
+        }
+        self.client = DirectReportClient(
+            [{"name": "sid", "value": "abc"}], TOTAL_SELECTORS, concurrency=2, retries=0
+        )
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_post_body_carries_the_requested_dates(self):
+        days = [dt.date(2026, 10, 3), dt.date(2026, 10, 4)]
+        self.client.fetch_totals([("Отдел", self.form, d) for d in days])
+        posted = sorted(sorted(fields) for fields, _cookie, _xhr in StandInReport.posted)
+        expected = sorted(
+            sorted([("UnitId", "42"), ("reportButton", ""), ("StartDate", f"{d:%d.%m.%Y}"), ("EndDate", f"{d:%d.%m.%Y}")])
+            for d in days
+        )
+        self.assertEqual(posted, expected)
+
+    def test_session_headers_are_sent(self):
+        self.client.fetch_totals([("Отдел", self.form, dt.date(2026, 10, 3))])
+        _fields, cookie, xhr = StandInReport.posted[0]
+        self.assertEqual(cookie, "sid=abc")
+        self.assertEqual(xhr, "XMLHttpRequest")
+
+    def test_totals_are_parsed(self):
+        days = [dt.date(2026, 10, 3), dt.date(2026, 10, 4)]
+        result = self.client.fetch_totals([("Отдел", self.form, d) for d in days])
+        self.assertEqual(result, {("Отдел", d): f"1{d:%d},50" for d in days})
+
+    def test_redirect_is_session_rejected(self):
+        expired = dict(self.form, action=self.base + "/expired")
+        day = dt.date(2026, 10, 3)
+        result = self.client.fetch_totals([("Отдел", expired, day)])
+        self.assertIsInstance(result[("Отдел", day)], SessionRejected)
+
+
+class ParseTotalTest(unittest.TestCase):
+    def test_total_cell_wins(self):
+        html = (
+            "<table><tbody><tr><td>a</td><td>1 000</td></tr>"
+            '<tr><td>Итого</td><td class="totalValue">12&nbsp;345,67 ₽</td></tr></tbody>'
+            "<tfoot><tr><td>99</td></tr></tfoot></table>"
+        )
+        self.assertEqual(parse_total(html, TOTAL_SELECTORS), "12345,67")
+
+    def test_falls_back_to_footer_then_last_cell(self):
+        footer = "<table><tbody><tr><td>b</td><td>2 500,10</td></tr></tbody><tfoot><tr><td>3 500,10</td></tr></tfoot></table>"
+        self.assertEqual(parse_total(footer, TOTAL_SELECTORS), "3500,10")
+        body = "<table><tbody><tr><td>a</td><td>1 000</td></tr><tr><td>b</td><td>2 500,10</td></tr></tbody></table>"
+        self.assertEqual(parse_total(body, TOTAL_SELECTORS), "2500,10")
+
+    def test_no_number_is_empty(self):
+        self.assertEqual(parse_total("<div>нет данных</div>", TOTAL_SELECTORS), "")
+
+
+if __name__ == "__main__":
+    unittest.main()